@@ -0,0 +1,270 @@
+# active_learning.py — decide which rows get labeled next (train.py) and which get reviewed (manual_label_editor.py)
+#
+#   python active_learning.py queue --rows 20000    # → training_data/train_text_only_<source>_active_r<N>.json
+#   then set ACTIVE_LEARNING = True in train.py (labels only the queues), merge, balance as usual.
+#
+# Priority = uncertainty (margin or entropy of the label scores) mixed with how much the row's likely
+# classes are still needed for balance; picks are spread over k-means clusters of cheap text embeddings
+# so one dense topic can't fill the whole budget.
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from iab_labels import iab_labels
+
+# CONFIG
+QUEUE_ROWS = 20000  # texts per labeling round
+UNCERTAINTY = "margin"  # "margin" → 1 - (p1 - p2), "entropy" → entropy / log(num labels)
+UNCERTAINTY_WEIGHT = 0.5  # priority = w · uncertainty + (1 - w) · need of the row's likely classes
+ROWS_PER_CLUSTER = 50  # diversity: k-means clusters = budget / this
+CLUSTER_CAP = 2.0  # a cluster fills at most this × its even share of the budget before the others get a turn
+EMBED_DIM = 64
+EMBED_FIT_ROWS = 50000  # rows used to fit the SVD projection
+PROXY_TRAIN_ROWS = 200000  # labeled rows used to train the proxy scorer when no cascade model exists
+SEED = 42
+
+
+def parse_scores(scores):
+    """"scores" column (JSON lists in iab_labels order, NaN for rows labeled without them) → [n, labels] array."""
+    probs = np.full((len(scores), len(iab_labels)), np.nan)
+    present = scores.notna().to_numpy()
+    if present.any():
+        probs[present] = np.array([json.loads(s) for s in scores[present]], dtype=np.float64)
+    return probs
+
+
+def uncertainty(probs, method=UNCERTAINTY):
+    """Per row in [0, 1]; 1 = the scorer can't tell the labels apart."""
+    if method == "entropy":
+        p = np.clip(probs, 1e-12, 1.0)
+        return -(p * np.log(p)).sum(axis=1) / np.log(probs.shape[1])
+    top2 = -np.sort(-probs, axis=1)[:, :2]
+    return 1.0 - (top2[:, 0] - top2[:, 1])
+
+
+def class_need(class_counts, max_per_class):
+    """Per iab_label: share of its MAX_SAMPLES_PER_CLASS quota that is still empty (0 = full)."""
+    counts = pd.Series(class_counts).reindex(iab_labels).fillna(0).to_numpy()
+    return np.clip(1.0 - counts / max_per_class, 0.0, 1.0)
+
+
+def priority(probs, need, weight=UNCERTAINTY_WEIGHT):
+    return weight * uncertainty(probs) + (1 - weight) * (probs @ need)
+
+
+def embed(texts, dim=EMBED_DIM, seed=SEED):
+    """Cheap dense text vectors: hashed char n-grams → SVD → unit length (no model forward passes)."""
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.preprocessing import normalize
+
+    hashed = HashingVectorizer(analyzer="char_wb", ngram_range=(3, 5), n_features=2**18,
+                               alternate_sign=False).transform(list(texts))
+    dim = min(dim, hashed.shape[0] - 1, hashed.shape[1] - 1)
+    if dim < 1:
+        return np.zeros((hashed.shape[0], 1))
+    fit_rows = np.random.default_rng(seed).permutation(hashed.shape[0])[:EMBED_FIT_ROWS]
+    svd = TruncatedSVD(n_components=dim, random_state=seed).fit(hashed[fit_rows])
+    return normalize(svd.transform(hashed))
+
+
+def clusters_for(texts, budget, seed=SEED):
+    from sklearn.cluster import MiniBatchKMeans
+
+    num_clusters = max(1, min(budget // ROWS_PER_CLUSTER, len(texts) // 2))
+    if num_clusters == 1:
+        return np.zeros(len(texts), dtype=np.int64)
+    return MiniBatchKMeans(n_clusters=num_clusters, random_state=seed, n_init=3,
+                           batch_size=4096).fit_predict(embed(texts, seed=seed))
+
+
+def diverse_top(scores, clusters, budget, cap=CLUSTER_CAP):
+    """Positions of `budget` high-scoring rows, at most cap × budget / clusters per cluster per round.
+
+    One sort: by (round, -score), where round = rank inside the row's cluster // share, so
+    every cluster's best rows come before any cluster's second helping.
+    """
+    if budget >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    share = max(1, int(np.ceil(budget / (clusters.max() + 1) * cap)))
+    order = np.lexsort((-scores, clusters))
+    sorted_clusters = clusters[order]
+    starts = np.flatnonzero(np.r_[True, sorted_clusters[1:] != sorted_clusters[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    picked = order[np.lexsort((-scores[order], rank // share))]
+    return picked[:budget]
+
+
+def select_review_rows(df_low_conf, class_counts, max_per_class=None):
+    """balance_and_split's "missing" candidates, chosen by uncertainty + diversity instead of confidence.
+
+    Same per-class quota as select_missing ((K - count) * 2). Rows with a stored "scores"
+    vector are ranked by margin / entropy; older rows (top-1 confidence only) fall back
+    to treating the rest of the probability mass as spread evenly.
+    """
+    from balance_and_split import MAX_SAMPLES_PER_CLASS
+
+    max_per_class = max_per_class or MAX_SAMPLES_PER_CLASS
+    wanted = (max_per_class - class_counts) * 2
+    wanted = wanted[wanted > 0]
+    df = df_low_conf[df_low_conf["iab_label"].isin(wanted.index)].reset_index(drop=True)
+    if df.empty:
+        return df
+
+    probs = parse_scores(df["scores"]) if "scores" in df.columns else np.full((len(df), len(iab_labels)), np.nan)
+    missing = np.isnan(probs).any(axis=1)
+    if missing.any():
+        # Only the top-1 confidence is known → the other labels share the remainder
+        confidence = df["confidence"].to_numpy(np.float64)[missing]
+        label_pos = pd.Index(iab_labels).get_indexer(df["iab_label"].astype(str)[missing])
+        rest = ((1.0 - confidence) / (len(iab_labels) - 1))[:, None]
+        probs[missing] = np.repeat(rest, len(iab_labels), axis=1)
+        probs[missing, label_pos] = confidence
+
+    scores = priority(probs, class_need(class_counts, max_per_class))
+    clusters = clusters_for(df["text"].astype(str), int(wanted.sum()))
+    picked = []
+    for label, quota in wanted.items():
+        rows = np.flatnonzero((df["iab_label"] == label).to_numpy())
+        if len(rows):
+            picked.append(rows[diverse_top(scores[rows], clusters[rows], int(quota))])
+    print(f"🎯 Active review selection: {sum(len(p) for p in picked)} rows by {UNCERTAINTY} + need + diversity "
+          f"({int(missing.sum())} rows without stored scores)")
+    return df.take(np.concatenate(picked)) if picked else df.iloc[:0]
+
+
+def proxy_probs(texts):
+    """Label probabilities for unlabeled texts without the zero-shot model: the cascade's TF-IDF model
+    (cascade_classifier.py) if trained, else the same model fitted on the combined dataset's labels."""
+    from cascade_classifier import CASCADE_MODEL_PATH, build_model, softmax
+
+    if os.path.exists(CASCADE_MODEL_PATH):
+        import joblib
+
+        bundle = joblib.load(CASCADE_MODEL_PATH)
+        model, classes = bundle["model"], bundle["classes"]
+        class_probs = softmax(model.decision_function(list(texts)) / bundle["temperature"])
+        print(f"🧠 Scoring the pool with {CASCADE_MODEL_PATH}")
+    else:
+        from balance_and_split import CONFIDENCE_THRESHOLD, INPUT_STEM
+        from dataset_io import read_dataset
+
+        labeled = read_dataset(INPUT_STEM, columns=["text", "iab_label", "confidence"])
+        labeled = labeled[(labeled["confidence"] >= CONFIDENCE_THRESHOLD) & labeled["iab_label"].notna()]
+        labeled = labeled.sample(min(len(labeled), PROXY_TRAIN_ROWS), random_state=SEED)
+        print(f"🧠 No {CASCADE_MODEL_PATH} → fitting a TF-IDF proxy scorer on {len(labeled)} labeled rows")
+        model = build_model().fit(labeled["text"].astype(str), labeled["iab_label"].astype(str))
+        classes = list(model.classes_)
+        class_probs = model.predict_proba(list(texts))
+
+    probs = np.zeros((len(texts), len(iab_labels)))
+    for j, label in enumerate(classes):
+        if label in iab_labels:
+            probs[:, iab_labels.index(label)] = class_probs[:, j]
+    return probs / probs.sum(axis=1, keepdims=True).clip(min=1e-12)
+
+
+def labeled_hashes():
+    """Hashes of every text already labeled (merged) or already queued in an earlier round."""
+    import merge_batches_from_chunks as merge
+    from dataset_io import dataset_exists, read_dataset
+    from train import ACTIVE_QUEUE_MARKER, TRAINING_FOLDER
+
+    hashes = set()
+    for stem in [merge.base_stem(), merge.OUTPUT_STEM]:
+        if dataset_exists(stem):
+            hashes.update(merge.hash_texts(read_dataset(stem, columns=["text"])["text"].astype(str)))
+            break
+    for path in glob.glob(os.path.join(TRAINING_FOLDER, f"train_text_only_*{ACTIVE_QUEUE_MARKER}*.json")):
+        queued = pd.read_json(path, lines=True)
+        if len(queued):
+            hashes.update(merge.hash_texts(queued["text"].astype(str)))
+    return hashes
+
+
+def unlabeled_pool():
+    """DataFrame[text, source] of input texts that are neither labeled nor queued (first copy of each)."""
+    import merge_batches_from_chunks as merge
+    from json_stream import JsonRecordReader
+    from train import ACTIVE_QUEUE_MARKER, TRAINING_FOLDER
+
+    frames = []
+    for path in sorted(glob.glob(os.path.join(TRAINING_FOLDER, "train_text_only_*.json"))):
+        if ACTIVE_QUEUE_MARKER in os.path.basename(path):
+            continue
+        source = os.path.basename(path).replace("train_text_only_", "").replace(".json", "")
+        texts = [r.get("text") for r in JsonRecordReader(path)]
+        frames.append(pd.DataFrame({"text": texts, "source": source}))
+    pool = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["text", "source"])
+    pool = pool[pool["text"].notna()]
+    pool = pool[pool["text"].astype(str).str.strip() != ""].astype({"text": str})
+
+    hashes = merge.hash_texts(pool["text"])
+    seen = labeled_hashes()
+    fresh = ~pd.Series(hashes).isin(seen).to_numpy() & ~pd.Series(hashes).duplicated().to_numpy()
+    return pool[fresh].reset_index(drop=True)
+
+
+def next_round():
+    from train import ACTIVE_QUEUE_MARKER, TRAINING_FOLDER
+
+    rounds = [int(path.rsplit(ACTIVE_QUEUE_MARKER, 1)[1].split(".")[0])
+              for path in glob.glob(os.path.join(TRAINING_FOLDER, f"train_text_only_*{ACTIVE_QUEUE_MARKER}*.json"))]
+    return max(rounds, default=0) + 1
+
+
+def write_label_queue(budget=QUEUE_ROWS):
+    """Pick the next `budget` texts for train.py → one JSONL queue per source, most important first."""
+    from balance_and_split import CONFIDENCE_THRESHOLD, INPUT_STEM, MAX_SAMPLES_PER_CLASS
+    from dataset_io import dataset_exists, read_dataset
+    from labeling_manifest import write_atomic
+    from train import ACTIVE_QUEUE_MARKER, TRAINING_FOLDER
+
+    if not dataset_exists(INPUT_STEM):
+        raise FileNotFoundError(f"❌ {INPUT_STEM} not found → label a first batch and run merge_batches_from_chunks.py.")
+    pool = unlabeled_pool()
+    print(f"📥 Unlabeled pool: {len(pool)} texts")
+    if pool.empty:
+        return []
+
+    labeled = read_dataset(INPUT_STEM, columns=["iab_label", "confidence"])
+    class_counts = labeled.loc[labeled["confidence"] >= CONFIDENCE_THRESHOLD, "iab_label"].astype(str).value_counts()
+    need = class_need(class_counts, MAX_SAMPLES_PER_CLASS)
+
+    probs = proxy_probs(pool["text"])
+    scores = priority(probs, need)
+    chosen = diverse_top(scores, clusters_for(pool["text"], budget), budget)
+    queue = pool.take(chosen).assign(priority=scores[chosen].round(4),
+                                     predicted=np.asarray(iab_labels, dtype=object)[probs[chosen].argmax(axis=1)])
+
+    round_id = next_round()
+    paths = []
+    for source, rows in queue.groupby("source", sort=False):
+        path = os.path.join(TRAINING_FOLDER, f"train_text_only_{source}{ACTIVE_QUEUE_MARKER}{round_id}.json")
+        records = rows[["text", "priority"]].to_dict("records")
+        write_atomic(path, lambda f: f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+        paths.append(path)
+        print(f"✅ {path}: {len(rows)} texts")
+
+    predicted = queue["predicted"].value_counts()
+    needy = [label for label, n in zip(iab_labels, need) if n > 0]
+    print(f"→ {predicted[predicted.index.isin(needy)].sum()} of {len(queue)} queued texts look like "
+          f"underfilled classes ({len(needy)} classes below {MAX_SAMPLES_PER_CLASS})")
+    print(f"→ Set ACTIVE_LEARNING = True in train.py to label round {round_id}.")
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Active-learning queues for labeling and review.")
+    parser.add_argument("command", choices=["queue"])
+    parser.add_argument("--rows", type=int, default=QUEUE_ROWS)
+    args = parser.parse_args()
+    write_label_queue(args.rows)
+
+
+if __name__ == "__main__":
+    main()
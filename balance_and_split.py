@@ -2,87 +2,126 @@ import pandas as pd
 import numpy as np
 import os
 from sklearn.model_selection import train_test_split
+from dataset_io import read_dataset, write_dataset, to_csv_frame
+from instrumentation import run_main, span, traced
 
 # CONFIG
-INPUT_FILE = "labeled_zero_shot_output_combined.csv"
+INPUT_STEM = "labeled_zero_shot_output_combined"  # .parquet or .csv, see dataset_io.STORAGE_FORMAT
+COLUMNS = ["text", "iab_label", "confidence", "source"]
 OUTPUT_FOLDER = "balanced_split_output"
 CLASS_FOLDER = os.path.join(OUTPUT_FOLDER, "classes")
 MISSING_FOLDER = os.path.join(OUTPUT_FOLDER, "missing_classes")
+BALANCED_STEM = os.path.join(OUTPUT_FOLDER, "balanced")  # top-K per class, before the split
 MAX_SAMPLES_PER_CLASS = 2000
 CONFIDENCE_THRESHOLD = 0.45
+MISSING_STRATEGY = "confidence"  # "confidence" → most confident low-confidence rows per class;
+# "active" → uncertainty (stored label scores) + class need + diversity, see active_learning.py
+
+
+def label_safe(label):
+    return label.replace(" ", "_").replace("’", "").replace(",", "").replace("–", "-")
+
+
+def rank_within_class(df):
+    """Order rows by (label, confidence desc) and rank them inside their class.
+
+    One sort on confidence, then a stable radix sort on the small-int label codes
+    (order is kept within each label) → (row positions in that order, 0-based rank,
+    label of each ordered row as an index into `labels`, labels). Rows without a
+    label are left out, as groupby would.
+    """
+    codes, labels = pd.factorize(df["iab_label"], sort=True)
+    order = np.argsort(-df["confidence"].to_numpy())
+    order = order[codes[order] >= 0]
+    order = order[np.argsort(codes[order].astype(np.int16), kind="stable")]
+
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return order, rank, sorted_codes, labels
+
+
+def select_balanced(df_high_conf, max_per_class=MAX_SAMPLES_PER_CLASS):
+    # Top-K most confident rows of every class, grouped by label
+    order, rank, _, _ = rank_within_class(df_high_conf)
+    return df_high_conf.take(order[rank < max_per_class]).reset_index(drop=True)
+
+
+def select_missing(df_low_conf, class_counts, max_per_class=MAX_SAMPLES_PER_CLASS):
+    # Per underrepresented class: the (K - count) * 2 most confident low-confidence rows
+    wanted = (max_per_class - class_counts) * 2
+    wanted = wanted[wanted > 0]
+    df_low_conf = df_low_conf[df_low_conf["iab_label"].isin(wanted.index)]  # full classes need nothing
+    order, rank, sorted_codes, labels = rank_within_class(df_low_conf)
+    quota_per_label = pd.Series(np.asarray(labels)).map(wanted).fillna(0).to_numpy()  # one entry per label
+    return df_low_conf.take(order[rank < quota_per_label[sorted_codes]])
+
+
+def iter_classes(df):
+    # df is grouped by label already → one pass, no per-label boolean filter over all rows
+    for label, df_class in df.groupby("iab_label", observed=True, sort=False):
+        yield label, df_class
+
+
+@traced("balance.export_classes")
+def export_class_files(balanced_df):
+    # Save one file per class (high confidence → used)
+    print(f"\n📦 Saving class-level balanced CSVs to: {CLASS_FOLDER}")
+    for label, df_class in iter_classes(balanced_df):
+        out_path = write_dataset(df_class, os.path.join(CLASS_FOLDER, f"class_{label_safe(label)}"))
+        print(f"✅ Saved: {out_path} ({len(df_class)} rows)")
+
+
+@traced("balance.export_missing")
+def export_missing_files(df_low_conf, balanced_df):
+    # Identify underrepresented classes and get missing samples from low-confidence data
+    print(f"\n🔍 Saving low-confidence 'missing' samples for underrepresented classes to: {MISSING_FOLDER}")
+    class_counts = balanced_df["iab_label"].value_counts()
+    class_counts = class_counts[class_counts > 0]  # categorical dtype also lists unused labels
+    if MISSING_STRATEGY == "active":
+        from active_learning import select_review_rows
+        missing_df = select_review_rows(df_low_conf, class_counts).drop(columns="scores", errors="ignore")
+    else:
+        missing_df = select_missing(df_low_conf, class_counts)
+    for label, top_missing in iter_classes(missing_df):
+        out_path = os.path.join(MISSING_FOLDER, f"missing_{label_safe(label)}.csv")
+        to_csv_frame(top_missing).to_csv(out_path, index=False)  # stays CSV → manual_label_editor.py
+        print(f"→ {label}: saved {len(top_missing)} missing samples")
+
+
+def drop_rare_classes(balanced_df):
+    # Remove classes with < 2 samples (can't be stratified)
+    valid_labels = balanced_df["iab_label"].value_counts()
+    valid_labels = valid_labels[valid_labels >= 2].index.tolist()
+    return balanced_df[balanced_df["iab_label"].isin(valid_labels)]
+
+
+def split_and_save(balanced_df):
+    balanced_df = drop_rare_classes(balanced_df)
+
+    # Stratified split into train/val/test
+    with span("balance.split", rows=len(balanced_df)):
+        train_val_df, test_df = train_test_split(
+            balanced_df, test_size=0.1, stratify=balanced_df["iab_label"], random_state=42
+        )
+        train_df, val_df = train_test_split(
+            train_val_df, test_size=0.1111, stratify=train_val_df["iab_label"], random_state=42
+        )
+
+    # Save splits
+    with span("balance.write_splits", rows=len(balanced_df)):
+        write_dataset(train_df, os.path.join(OUTPUT_FOLDER, "train"))
+        write_dataset(val_df, os.path.join(OUTPUT_FOLDER, "val"))
+        write_dataset(test_df, os.path.join(OUTPUT_FOLDER, "test"))
+    print(f"\n✅ Saved splits: train ({len(train_df)}), val ({len(val_df)}), test ({len(test_df)})")
+    return balanced_df, train_df, val_df, test_df
 
-# Load full dataset
-df_all = pd.read_csv(INPUT_FILE)
-
-# Split low- and high-confidence sets
-df_low_conf = df_all[df_all["confidence"] < CONFIDENCE_THRESHOLD]
-df_high_conf = df_all[df_all["confidence"] >= CONFIDENCE_THRESHOLD].reset_index(drop=True)
-
-print(f"\n✅ Filtered examples below confidence {CONFIDENCE_THRESHOLD}:")
-print(f"→ Low confidence removed: {len(df_low_conf)} rows")
-print(f"→ High confidence retained: {len(df_high_conf)} rows")
-
-# Create output folders
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-os.makedirs(CLASS_FOLDER, exist_ok=True)
-os.makedirs(MISSING_FOLDER, exist_ok=True)
-
-# Balance high-confidence dataset
-balanced_df = (
-    df_high_conf.groupby("iab_label")
-    .apply(lambda x: x.sort_values("confidence", ascending=False).head(MAX_SAMPLES_PER_CLASS))
-    .reset_index(drop=True)
-)
-
-# Save one CSV per class (high confidence → used)
-print(f"\n📦 Saving class-level balanced CSVs to: {CLASS_FOLDER}")
-for label in balanced_df["iab_label"].unique():
-    df_class = balanced_df[balanced_df["iab_label"] == label].sort_values("confidence", ascending=False)
-    label_safe = label.replace(" ", "_").replace("’", "").replace(",", "").replace("–", "-")
-    out_path = os.path.join(CLASS_FOLDER, f"class_{label_safe}.csv")
-    df_class.to_csv(out_path, index=False)
-    print(f"✅ Saved: {out_path} ({len(df_class)} rows)")
-
-# Identify underrepresented classes and get missing samples from low-confidence data
-print(f"\n🔍 Saving low-confidence 'missing' samples for underrepresented classes to: {MISSING_FOLDER}")
-class_counts = balanced_df["iab_label"].value_counts()
-for label in class_counts.index:
-    current_count = class_counts[label]
-    missing_count = (MAX_SAMPLES_PER_CLASS - current_count)*2
-    if missing_count > 0:
-        missing_candidates = df_low_conf[df_low_conf["iab_label"] == label]
-        if not missing_candidates.empty:
-            top_missing = missing_candidates.sort_values("confidence", ascending=False).head(missing_count)
-            if not top_missing.empty:
-                label_safe = label.replace(" ", "_").replace("’", "").replace(",", "").replace("–", "-")
-                out_path = os.path.join(MISSING_FOLDER, f"missing_{label_safe}.csv")
-                top_missing.to_csv(out_path, index=False)
-                print(f"→ {label}: saved {len(top_missing)} missing samples")
-
-# Remove classes with < 2 samples before splitting
-valid_labels = balanced_df["iab_label"].value_counts()
-valid_labels = valid_labels[valid_labels >= 2].index.tolist()
-balanced_df = balanced_df[balanced_df["iab_label"].isin(valid_labels)]
-
-# Stratified split into train/val/test
-train_val_df, test_df = train_test_split(
-    balanced_df, test_size=0.1, stratify=balanced_df["iab_label"], random_state=42
-)
-train_df, val_df = train_test_split(
-    train_val_df, test_size=0.1111, stratify=train_val_df["iab_label"], random_state=42
-)
-
-# Save splits
-train_df.to_csv(os.path.join(OUTPUT_FOLDER, "train.csv"), index=False)
-val_df.to_csv(os.path.join(OUTPUT_FOLDER, "val.csv"), index=False)
-test_df.to_csv(os.path.join(OUTPUT_FOLDER, "test.csv"), index=False)
-print(f"\n✅ Saved splits: train ({len(train_df)}), val ({len(val_df)}), test ({len(test_df)})")
 
 # Generate metadata
 def generate_metadata(df, filename):
     source_exists = "source" in df.columns
     if source_exists:
-        meta = df.groupby("iab_label").agg(
+        meta = df.groupby("iab_label", observed=True).agg(
             num_samples=("text", "count"),
             avg_confidence=("confidence", "mean"),
             num_synthetic=("source", lambda x: (x == "synthetic").sum()),
@@ -96,26 +135,78 @@ def generate_metadata(df, filename):
 
     else:
         print("⚠️ No 'source' column found → skipping source breakdown.")
-        meta = df.groupby("iab_label").agg(
+        meta = df.groupby("iab_label", observed=True).agg(
             num_samples=("text", "count"),
             avg_confidence=("confidence", "mean")
         ).reset_index()
 
-    meta.to_csv(os.path.join(OUTPUT_FOLDER, filename), index=False)
+    to_csv_frame(meta).to_csv(os.path.join(OUTPUT_FOLDER, filename), index=False)
     print(f"📊 Saved: {filename}")
 
-generate_metadata(train_df, "metadata_train.csv")
-generate_metadata(val_df, "metadata_val.csv")
-generate_metadata(test_df, "metadata_test.csv")
-generate_metadata(balanced_df, "metadata_balanced.csv")
-
-metadata_path = os.path.join(OUTPUT_FOLDER, "metadata_balanced.csv")
-if os.path.exists(metadata_path):
-    meta_df = pd.read_csv(metadata_path)
-    low_conf_classes = meta_df[meta_df["avg_confidence"] < 0.75]
-    if not low_conf_classes.empty:
-        print(f"\n⚠️ WARNING: {len(low_conf_classes)} class(es) have average confidence below 0.75!")
-        print("Classes affected:")
-        print(low_conf_classes[["iab_label", "avg_confidence"]])
-    else:
-        print("\n✅ All classes have average confidence ≥ 0.75.")
\ No newline at end of file
+
+def check_confidence():
+    metadata_path = os.path.join(OUTPUT_FOLDER, "metadata_balanced.csv")
+    if os.path.exists(metadata_path):
+        meta_df = pd.read_csv(metadata_path)
+        low_conf_classes = meta_df[meta_df["avg_confidence"] < 0.75]
+        if not low_conf_classes.empty:
+            print(f"\n⚠️ WARNING: {len(low_conf_classes)} class(es) have average confidence below 0.75!")
+            print("Classes affected:")
+            print(low_conf_classes[["iab_label", "avg_confidence"]])
+        else:
+            print("\n✅ All classes have average confidence ≥ 0.75.")
+
+
+def make_folders():
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    os.makedirs(CLASS_FOLDER, exist_ok=True)
+    os.makedirs(MISSING_FOLDER, exist_ok=True)
+
+
+def balance():
+    """Combined dataset → balanced top-K per class (saved as BALANCED_STEM) + 'missing' files."""
+    # Load full dataset (only the columns used downstream)
+    with span("balance.read") as step:
+        df_all = read_dataset(INPUT_STEM, columns=COLUMNS + (["scores"] if MISSING_STRATEGY == "active" else []))
+        step.rows = len(df_all)
+
+    # Split low- and high-confidence sets
+    df_low_conf = df_all[df_all["confidence"] < CONFIDENCE_THRESHOLD]
+    df_high_conf = df_all[df_all["confidence"] >= CONFIDENCE_THRESHOLD].drop(columns="scores", errors="ignore")
+    df_high_conf = df_high_conf.reset_index(drop=True)
+
+    print(f"\n✅ Filtered examples below confidence {CONFIDENCE_THRESHOLD}:")
+    print(f"→ Low confidence removed: {len(df_low_conf)} rows")
+    print(f"→ High confidence retained: {len(df_high_conf)} rows")
+
+    # Create output folders
+    make_folders()
+
+    # Balance high-confidence dataset
+    with span("balance.select", rows=len(df_high_conf)):
+        balanced_df = select_balanced(df_high_conf)
+    with span("balance.write_balanced", rows=len(balanced_df)):
+        write_dataset(balanced_df, BALANCED_STEM)
+
+    export_missing_files(df_low_conf, balanced_df)
+    return balanced_df
+
+
+@traced("balance.metadata")
+def write_metadata(balanced_df, train_df, val_df, test_df):
+    generate_metadata(train_df, "metadata_train.csv")
+    generate_metadata(val_df, "metadata_val.csv")
+    generate_metadata(test_df, "metadata_test.csv")
+    generate_metadata(drop_rare_classes(balanced_df), "metadata_balanced.csv")
+    check_confidence()
+
+
+def main():
+    balanced_df = balance()
+    export_class_files(balanced_df)
+    _, train_df, val_df, test_df = split_and_save(balanced_df)
+    write_metadata(balanced_df, train_df, val_df, test_df)
+
+
+if __name__ == "__main__":
+    run_main(main, "balance_and_split")
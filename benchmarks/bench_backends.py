@@ -0,0 +1,82 @@
+# bench_backends.py — rows/sec and parity with the reference BART-MNLI pipeline, per labeling backend
+#
+#   python benchmarks/bench_backends.py --backends pipeline quantized onnx --sample-size 200
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iab_labels import candidate_labels  # noqa: E402
+from labeling_backends import load_classifier, sample_training_texts  # noqa: E402
+from zero_shot_engine import ThroughputStats, label_texts  # noqa: E402
+
+WARMUP_ROWS = 8
+
+
+def run_backend(backend, texts, device):
+    """Load + label texts once → (outputs, load seconds, ThroughputStats)."""
+    start = time.perf_counter()
+    classifier = load_classifier(backend, device=device)
+    load_seconds = time.perf_counter() - start
+
+    label_texts(classifier, texts[:WARMUP_ROWS], candidate_labels)  # first call pays one-off allocations
+    stats = ThroughputStats()
+    outputs = label_texts(classifier, texts, candidate_labels, stats=stats)
+    return outputs, load_seconds, stats
+
+
+def parity(reference, outputs):
+    """Top-1 label agreement and top-1 confidence differences against the reference outputs."""
+    pairs = [(r, o) for r, o in zip(reference, outputs) if r is not None and o is not None]
+    diffs = [abs(r["scores"][0] - o["scores"][0]) for r, o in pairs]
+    return {
+        "top1_agreement": sum(r["labels"][0] == o["labels"][0] for r, o in pairs) / len(pairs),
+        # train.py stores round(confidence, 2) → how often the saved value would be identical
+        "confidence_equal_2dp": sum(round(r["scores"][0], 2) == round(o["scores"][0], 2) for r, o in pairs) / len(pairs),
+        "mean_abs_confidence_diff": sum(diffs) / len(diffs),
+        "max_abs_confidence_diff": max(diffs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare labeling backends: throughput and parity with 'pipeline'.")
+    parser.add_argument("--backends", nargs="+", default=["pipeline", "quantized", "onnx"])
+    parser.add_argument("--reference", default="pipeline")
+    parser.add_argument("--sample-size", type=int, default=200)
+    parser.add_argument("--training-folder", default="training_data")
+    parser.add_argument("--device", type=int, default=-1, help="GPU index for torch backends, -1 → CPU")
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    texts = [t for t in sample_training_texts(args.training_folder, args.sample_size) if isinstance(t, str) and t.strip()]
+    print(f"🔍 {len(texts)} texts, reference '{args.reference}'")
+
+    backends = [args.reference] + [b for b in args.backends if b != args.reference]
+    results, reference = [], None
+    for backend in backends:
+        outputs, load_seconds, stats = run_backend(backend, texts, args.device)
+        reference = reference or outputs
+        result = {"backend": backend, "load_seconds": round(load_seconds, 2), "rows": stats.rows,
+                  "seconds": round(stats.seconds, 3), "rows_per_sec": round(stats.rows_per_sec, 2),
+                  **parity(reference, outputs)}
+        results.append(result)
+        print(f"✅ {backend}: {stats.rows_per_sec:.1f} rows/sec (loaded in {load_seconds:.1f}s), "
+              f"top-1 agreement {result['top1_agreement']:.1%}, mean |Δ confidence| {result['mean_abs_confidence_diff']:.4f}")
+
+    base = results[0]["rows_per_sec"] or 1e-9
+    print(f"\n{'backend':<12} {'rows/s':>9} {'speedup':>8} {'top-1':>7} {'conf=2dp':>9} {'mean |Δ|':>9} {'max |Δ|':>8}")
+    for r in results:
+        print(f"{r['backend']:<12} {r['rows_per_sec']:>9.1f} {r['rows_per_sec'] / base:>7.2f}x {r['top1_agreement']:>7.1%} "
+              f"{r['confidence_equal_2dp']:>9.1%} {r['mean_abs_confidence_diff']:>9.4f} {r['max_abs_confidence_diff']:>8.4f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"reference": args.reference, "sample_size": len(texts), "results": results}, f, indent=2)
+        print(f"✅ Results → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# bench_balance_and_split.py — legacy per-class loops vs. single-sort groupby-rank balancing
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from balance_and_split import (  # noqa: E402
+    CONFIDENCE_THRESHOLD, MAX_SAMPLES_PER_CLASS, iter_classes, select_balanced, select_missing,
+)
+from iab_labels import iab_labels  # noqa: E402
+
+
+def synthetic_labeled(num_rows, seed=42):
+    """Skewed 24-class labeled frame shaped like labeled_zero_shot_output_combined."""
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, len(iab_labels) + 1) ** 2.5  # a few big classes, a long underfilled tail
+    labels = rng.choice(len(iab_labels), size=num_rows, p=weights / weights.sum())
+    return pd.DataFrame({
+        "text": pd.Series(np.arange(num_rows)).astype(str).radd("query "),
+        "iab_label": pd.Categorical.from_codes(labels, categories=iab_labels),
+        "confidence": rng.random(num_rows, dtype=np.float32),
+        "source": pd.Categorical.from_codes(rng.choice(3, size=num_rows, p=[0.3, 0.65, 0.05]),
+                                            categories=["synthetic", "natural", "manual"]),
+    })
+
+
+def legacy(df_high_conf, df_low_conf):
+    # The pre-vectorized balance_and_split.py: apply() per class, then one full-frame filter per label
+    balanced_df = (
+        df_high_conf.groupby("iab_label", observed=True)[df_high_conf.columns.tolist()]
+        .apply(lambda x: x.sort_values("confidence", ascending=False).head(MAX_SAMPLES_PER_CLASS))
+        .reset_index(drop=True)
+    )
+    for label in balanced_df["iab_label"].unique():
+        balanced_df[balanced_df["iab_label"] == label].sort_values("confidence", ascending=False)
+    class_counts = balanced_df["iab_label"].value_counts()
+    for label in class_counts[class_counts > 0].index:
+        missing_count = (MAX_SAMPLES_PER_CLASS - class_counts[label]) * 2
+        if missing_count > 0:
+            df_low_conf[df_low_conf["iab_label"] == label].sort_values("confidence", ascending=False).head(missing_count)
+
+
+def vectorized(df_high_conf, df_low_conf):
+    balanced_df = select_balanced(df_high_conf)
+    for _ in iter_classes(balanced_df):
+        pass
+    class_counts = balanced_df["iab_label"].value_counts()
+    for _ in iter_classes(select_missing(df_low_conf, class_counts[class_counts > 0])):
+        pass
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark balancing + per-class partitioning (no file I/O).")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--legacy-max-rows", type=int, default=5_000_000, help="skip the legacy path above this size")
+    parser.add_argument("--label-dtype", choices=["category", "str"], default="category",
+                        help="category = loaded from Parquet, str = loaded from CSV")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} | {'legacy (s)':>10} | {'vectorized (s)':>14} | {'speedup':>7}")
+    for num_rows in args.sizes:
+        df = synthetic_labeled(num_rows)
+        if args.label_dtype == "str":
+            df = df.astype({"iab_label": str, "source": str})
+        df_low_conf = df[df["confidence"] < CONFIDENCE_THRESHOLD]
+        df_high_conf = df[df["confidence"] >= CONFIDENCE_THRESHOLD].reset_index(drop=True)
+
+        new_s = timed(vectorized, df_high_conf, df_low_conf)
+        if num_rows <= args.legacy_max_rows:
+            old_s = timed(legacy, df_high_conf, df_low_conf)
+            print(f"{num_rows:>10} | {old_s:>10.2f} | {new_s:>14.2f} | {old_s / new_s:>6.1f}x")
+        else:
+            print(f"{num_rows:>10} | {'skipped':>10} | {new_s:>14.2f} | {'-':>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# bench_batching.py — length-bucketed batching vs the original loop (batch_size=1 pipeline calls) on one backend
+#
+#   python benchmarks/bench_batching.py --sample-size 500 --device -1
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iab_labels import candidate_labels  # noqa: E402
+from labeling_backends import load_classifier, sample_training_texts  # noqa: E402
+from zero_shot_engine import ThroughputStats, label_texts  # noqa: E402
+
+WARMUP_ROWS = 8
+
+
+def run_mode(classifier, texts, bucketed, max_batch_tokens, max_batch_rows):
+    label_texts(classifier, texts[:WARMUP_ROWS], candidate_labels, max_batch_tokens, max_batch_rows, bucketed)
+    stats = ThroughputStats()
+    outputs = label_texts(classifier, texts, candidate_labels, max_batch_tokens, max_batch_rows, bucketed, stats=stats)
+    return outputs, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare bucketed batching with the original per-pair pipeline calls.")
+    parser.add_argument("--backend", default="pipeline")
+    parser.add_argument("--sample-size", type=int, default=500)
+    parser.add_argument("--training-folder", default="training_data")
+    parser.add_argument("--device", type=int, default=-1, help="GPU index, -1 → CPU")
+    parser.add_argument("--max-batch-tokens", type=int, nargs="+", default=[8192],
+                        help="token budgets to try for the bucketed mode")
+    parser.add_argument("--max-batch-rows", type=int, default=64)
+    parser.add_argument("--legacy-rows", type=int, default=16, help="texts per call in the original loop (INFER_BATCH_SIZE)")
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    texts = [t for t in sample_training_texts(args.training_folder, args.sample_size) if isinstance(t, str) and t.strip()]
+    classifier = load_classifier(args.backend, device=args.device)
+    print(f"🔍 {len(texts)} texts, backend '{args.backend}', device {args.device}")
+
+    modes = [("legacy", False, float("inf"), args.legacy_rows)]
+    modes += [(f"bucketed@{budget}", True, budget, args.max_batch_rows) for budget in args.max_batch_tokens]
+    results, reference = [], None
+    for name, bucketed, budget, rows in modes:
+        outputs, stats = run_mode(classifier, texts, bucketed, budget, rows)
+        reference = reference or outputs
+        agree = sum(r["labels"][0] == o["labels"][0] for r, o in zip(reference, outputs) if r and o) / len(texts)
+        results.append({"mode": name, "rows_per_sec": round(stats.rows_per_sec, 2), "seconds": round(stats.seconds, 3),
+                        "forward_passes": stats.batches, "padding_ratio": round(stats.padding_ratio, 4),
+                        "top1_agreement": agree})
+        print(f"✅ {stats.report(prefix=name + ':')} | top-1 agreement with legacy {agree:.1%}")
+
+    base = results[0]["rows_per_sec"] or 1e-9
+    print(f"\n{'mode':<18} {'rows/s':>9} {'speedup':>8} {'passes':>8} {'padding':>8}")
+    for r in results:
+        print(f"{r['mode']:<18} {r['rows_per_sec']:>9.1f} {r['rows_per_sec'] / base:>7.2f}x "
+              f"{r['forward_passes']:>8} {r['padding_ratio']:>8.1%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"backend": args.backend, "device": args.device, "sample_size": len(texts), "results": results}, f, indent=2)
+        print(f"✅ Results → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# run_benchmarks.py — time each pipeline stage on synthetic corpora of several sizes
+#
+#   python benchmarks/run_benchmarks.py --sizes 10000 100000 1000000 --output bench_before.json
+#   python benchmarks/run_benchmarks.py --compare bench_before.json bench_after.json
+#
+# Each size gets its own work directory (synthetic output_chunks/ + a copy of the repo's scripts);
+# every stage runs as a separate process so wall time and peak RSS belong to that stage alone.
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+from synthetic_corpus import ensure_tree
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_WORKDIR = "/tmp/iab_benchmarks"
+REGRESSION_TOLERANCE = 0.10  # --compare flags stages that got >10% slower or bigger
+
+# name → (script, paths removed before the run → cold / warm starts)
+STAGES = {
+    "merge_cold": ("merge_batches_from_chunks.py", [
+        ".merge_state", "labeled_zero_shot_output_combined.*", "near_duplicate_*"]),
+    "merge_noop": ("merge_batches_from_chunks.py", []),  # nothing changed since merge_cold → incremental no-op
+    "balance_and_split": ("balance_and_split.py", ["balanced_split_output"]),
+    "pipeline_cold": ("run_full_pipeline.py", [
+        ".merge_state", ".pipeline_state", "labeled_zero_shot_output_combined.*", "near_duplicate_*",
+        "balanced_split_output"]),
+    "pipeline_noop": ("run_full_pipeline.py", []),  # every stage up to date → hashing + skips only
+}
+
+
+def copy_scripts(workdir):
+    # The scripts use paths relative to the working directory → run a copy inside each work directory
+    for path in glob.glob(os.path.join(REPO_ROOT, "*.py")):
+        shutil.copy2(path, workdir)
+
+
+def reset(workdir, patterns):
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(workdir, pattern)):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+
+def run_stage(workdir, script, log_path):
+    """Run one script to completion → (seconds, peak RSS in MB, return code)."""
+    env = dict(os.environ, MPLBACKEND="Agg")
+    with open(log_path, "w") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, script], cwd=workdir, stdout=log, stderr=subprocess.STDOUT, env=env)
+        # wait4 → resource usage of this child alone (ru_maxrss is in KB on Linux)
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return seconds, usage.ru_maxrss / 1024, process.returncode
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import numpy
+    import pandas
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+    }
+
+
+def run_benchmarks(sizes, stages, workdir, repeat=1, seed=42):
+    results = []
+    for size in sizes:
+        size_dir = os.path.join(workdir, f"rows_{size}")
+        start = time.perf_counter()
+        num_files = ensure_tree(size_dir, size, seed)
+        print(f"📦 {size} rows in {num_files} chunk files ({time.perf_counter() - start:.1f}s) → {size_dir}")
+        copy_scripts(size_dir)
+
+        for name in stages:
+            script, reset_patterns = STAGES[name]
+            for run in range(repeat):
+                reset(size_dir, reset_patterns)
+                log_path = os.path.join(size_dir, f"bench_{name}_{run}.log")
+                seconds, peak_rss_mb, returncode = run_stage(size_dir, script, log_path)
+                status = "✅" if returncode == 0 else f"❌ exit {returncode}, see {log_path}"
+                print(f"   ⏱️ {name:<18} {seconds:8.2f}s  {peak_rss_mb:8.0f} MB  {size / seconds:>12,.0f} rows/s  {status}")
+                results.append({
+                    "rows": size, "stage": name, "run": run, "seconds": round(seconds, 3),
+                    "peak_rss_mb": round(peak_rss_mb, 1), "rows_per_sec": round(size / seconds, 1),
+                    "returncode": returncode,
+                })
+    return results
+
+
+def best_runs(results):
+    # (rows, stage) → fastest successful run
+    best = {}
+    for r in results:
+        key = (r["rows"], r["stage"])
+        if r["returncode"] == 0 and (key not in best or r["seconds"] < best[key]["seconds"]):
+            best[key] = r
+    return best
+
+
+def compare(old_path, new_path, tolerance=REGRESSION_TOLERANCE):
+    """Print old vs new time / peak RSS per (rows, stage) → number of regressions."""
+    with open(old_path, "r") as f:
+        old = json.load(f)
+    with open(new_path, "r") as f:
+        new = json.load(f)
+    old_best, new_best = best_runs(old["results"]), best_runs(new["results"])
+
+    print(f"📊 {old_path} ({old['environment'].get('commit')}) → {new_path} ({new['environment'].get('commit')})")
+    print(f"{'rows':>10} {'stage':<18} {'old s':>9} {'new s':>9} {'time':>8} {'old MB':>8} {'new MB':>8} {'RSS':>8}")
+    regressions = 0
+    for key in sorted(set(old_best) & set(new_best)):
+        o, n = old_best[key], new_best[key]
+        time_ratio = n["seconds"] / max(o["seconds"], 1e-9)
+        rss_ratio = n["peak_rss_mb"] / max(o["peak_rss_mb"], 1e-9)
+        regressed = time_ratio > 1 + tolerance or rss_ratio > 1 + tolerance
+        regressions += regressed
+        print(f"{key[0]:>10} {key[1]:<18} {o['seconds']:>9.2f} {n['seconds']:>9.2f} {time_ratio:>7.2f}x "
+              f"{o['peak_rss_mb']:>8.0f} {n['peak_rss_mb']:>8.0f} {rss_ratio:>7.2f}x{'  ⚠️' if regressed else ''}")
+
+    for key in sorted(set(old_best) ^ set(new_best)):
+        print(f"ℹ️ {key[0]} rows / {key[1]} only in {old_path if key in old_best else new_path}")
+    if regressions:
+        print(f"⚠️ {regressions} stage(s) more than {tolerance:.0%} slower or bigger")
+    else:
+        print("✅ No regressions")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic corpora.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage; --compare uses the fastest")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, tolerance=args.tolerance) else 0)
+
+    results = run_benchmarks(args.sizes, args.stages, args.workdir, args.repeat, args.seed)
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "seed": args.seed, "results": results}, f, indent=2)
+    print(f"✅ Results → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
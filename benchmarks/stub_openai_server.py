@@ -0,0 +1,106 @@
+# stub_openai_server.py — local stand-in for the chat completions API (latency + injected 429/500s)
+#
+#   python benchmarks/stub_openai_server.py --port 8089 --latency 0.5 --error-rate 0.2
+#   OPENAI_API_KEY=stub python generate_phrases.py --base-url http://127.0.0.1:8089/v1
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATS = {"requests": 0, "ok": 0, "rate_limited": 0, "server_errors": 0, "max_in_flight": 0}
+STATS_LOCK = threading.Lock()
+IN_FLIGHT = [0]
+SUFFIXES = ["near me", "ideas", "reviews", "for beginners", "tips", "news", "prices", "guide", "online", "best deals"]
+
+
+def completion(model, content):
+    return {
+        "id": f"chatcmpl-stub-{random.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 40, "completion_tokens": 30, "total_tokens": 70},
+    }
+
+
+def make_handler(latency, jitter, error_rate, retry_after):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with STATS_LOCK:
+                    return self.send_json(200, STATS)
+            self.send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            if not self.path.endswith("/chat/completions"):
+                return self.send_json(404, {"error": {"message": "not found"}})
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with STATS_LOCK:
+                STATS["requests"] += 1
+                IN_FLIGHT[0] += 1
+                STATS["max_in_flight"] = max(STATS["max_in_flight"], IN_FLIGHT[0])
+            try:
+                time.sleep(max(0.0, random.gauss(latency, jitter)))
+                roll = random.random()
+                if roll < error_rate / 2:
+                    with STATS_LOCK:
+                        STATS["rate_limited"] += 1
+                    headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+                    return self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, headers)
+                if roll < error_rate:
+                    with STATS_LOCK:
+                        STATS["server_errors"] += 1
+                    return self.send_json(500, {"error": {"message": "The server had an error"}})
+
+                topic = request["messages"][-1]["content"].split("Topic: ")[-1].split(".")[0]
+                lines = [f"{i}. {topic.lower()} {suffix}" for i, suffix in enumerate(SUFFIXES, start=1)]
+                with STATS_LOCK:
+                    STATS["ok"] += 1
+                self.send_json(200, completion(request.get("model", "stub"), "\n".join(lines)))
+            finally:
+                with STATS_LOCK:
+                    IN_FLIGHT[0] -= 1
+
+        def log_message(self, format, *args):
+            pass  # keep the console for the stats line
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub chat completions server for generate_phrases.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction answered 429 / 500 (half each)")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with 429s")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port),
+                                 make_handler(args.latency, args.jitter, args.error_rate, args.retry_after))
+    print(f"🧪 Stub API on http://{args.host}:{args.port}/v1 (GET /stats for counters)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"📊 {STATS}")
+
+
+if __name__ == "__main__":
+    main()
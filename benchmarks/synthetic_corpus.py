@@ -0,0 +1,126 @@
+# synthetic_corpus.py — generate output_chunks/ trees shaped like train.py output, at any size
+#
+#   python benchmarks/synthetic_corpus.py --rows 1000000 --root /tmp/corpus_1m
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iab_labels import iab_labels  # noqa: E402
+
+BATCH_ROWS = 1000  # rows per labeled_batch_*.csv, like train.py's BATCH_SIZE
+CHUNK_ROWS = 200_000  # rows generated in memory at a time
+SOURCES = {  # folder → share of rows
+    "output_chunks_natural": 0.65,
+    "output_chunks_synthetic_1": 0.30,
+    "output_chunks_manual": 0.05,
+}
+CLASS_SKEW = 1.2  # zipf exponent over the 24 classes (a few big classes, a long tail)
+VOCAB_PER_CLASS = 400
+SHARED_VOCAB = 600
+DUPLICATE_RATE = 0.03  # exact repeats of earlier texts (possibly in other files)
+NEAR_DUPLICATE_RATE = 0.03  # case / punctuation variants of earlier texts
+MARKER_FILE = "corpus.json"
+
+
+def class_weights():
+    weights = 1 / np.arange(1, len(iab_labels) + 1) ** CLASS_SKEW
+    return weights / weights.sum()
+
+
+def vocabularies(rng):
+    # Class-specific words + words every class uses → word frequencies and near-duplicates look plausible
+    class_vocab = np.array([[f"{label.split()[0].lower()}w{i}" for i in range(VOCAB_PER_CLASS)] for label in iab_labels])
+    shared_vocab = np.array([f"common{i}" for i in range(SHARED_VOCAB)])
+    return class_vocab, shared_vocab
+
+
+def synthetic_chunk(num_rows, rng, class_vocab, shared_vocab, offset):
+    """num_rows rows of text / iab_label / confidence, plus a unique id so texts rarely collide by chance."""
+    labels = rng.choice(len(iab_labels), size=num_rows, p=class_weights())
+    num_words = rng.integers(2, 7, size=num_rows)
+    words = []
+    for position in range(6):
+        shared = rng.random(num_rows) < 0.3
+        word = np.where(shared, shared_vocab[rng.integers(0, SHARED_VOCAB, num_rows)],
+                        class_vocab[labels, rng.integers(0, VOCAB_PER_CLASS, num_rows)])
+        words.append(pd.Series(np.where(position < num_words, word, "")))
+    texts = words[0].str.cat(words[1:], sep=" ").str.strip().str.replace(r"\s+", " ", regex=True)
+    texts = texts + " q" + pd.Series(np.arange(offset, offset + num_rows)).astype(str)
+
+    # Exact and near duplicates of rows earlier in the chunk
+    copy = rng.random(num_rows)
+    source_rows = (rng.random(num_rows) * np.arange(num_rows)).astype(np.int64)
+    exact = copy < DUPLICATE_RATE
+    near = (copy >= DUPLICATE_RATE) & (copy < DUPLICATE_RATE + NEAR_DUPLICATE_RATE)
+    texts[exact] = texts.to_numpy()[source_rows[exact]]
+    texts[near] = pd.Series(texts.to_numpy()[source_rows[near]]).str.upper().to_numpy() + "!"
+
+    return pd.DataFrame({
+        "text": texts,
+        "iab_label": np.asarray(iab_labels, dtype=object)[labels],
+        "confidence": rng.beta(2.0, 4.0, size=num_rows).round(2),
+    })
+
+
+def generate_tree(root, num_rows, seed=42, batch_rows=BATCH_ROWS):
+    """Write <root>/output_chunks/<folder>/*.csv with num_rows rows in total; returns the file count."""
+    chunks_root = os.path.join(root, "output_chunks")
+    if os.path.exists(chunks_root):
+        shutil.rmtree(chunks_root)
+    for folder in SOURCES:
+        os.makedirs(os.path.join(chunks_root, folder))
+
+    rng = np.random.default_rng(seed)
+    class_vocab, shared_vocab = vocabularies(rng)
+    folders = list(SOURCES)
+    next_row = dict.fromkeys(folders, 0)
+    num_files = 0
+    for chunk_start in range(0, num_rows, CHUNK_ROWS):
+        df = synthetic_chunk(min(CHUNK_ROWS, num_rows - chunk_start), rng, class_vocab, shared_vocab, chunk_start)
+        df["folder"] = rng.choice(len(folders), size=len(df), p=list(SOURCES.values()))
+        for folder_id, folder_df in df.groupby("folder"):
+            folder = folders[folder_id]
+            folder_df = folder_df.drop(columns="folder")
+            for start in range(0, len(folder_df), batch_rows):
+                part = folder_df.iloc[start:start + batch_rows]
+                first = next_row[folder]
+                # manual_label_editor.py writes missing_*.csv, train.py labeled_batch_<start>_<end>.csv
+                name = (f"missing_part_{first}.csv" if folder == "output_chunks_manual"
+                        else f"labeled_batch_{first}_{first + batch_rows}.csv")
+                part.to_csv(os.path.join(chunks_root, folder, name), index=False)
+                next_row[folder] += len(part)
+                num_files += 1
+
+    with open(os.path.join(root, MARKER_FILE), "w") as f:
+        json.dump({"rows": num_rows, "seed": seed, "batch_rows": batch_rows, "files": num_files}, f)
+    return num_files
+
+
+def ensure_tree(root, num_rows, seed=42):
+    """Generate the tree unless <root> already holds one with the same size and seed."""
+    marker = os.path.join(root, MARKER_FILE)
+    if os.path.exists(marker):
+        with open(marker, "r") as f:
+            info = json.load(f)
+        if info.get("rows") == num_rows and info.get("seed") == seed:
+            return info["files"]
+    os.makedirs(root, exist_ok=True)
+    return generate_tree(root, num_rows, seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic output_chunks/ tree.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--root", required=True, help="directory that receives output_chunks/")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    files = generate_tree(args.root, args.rows, args.seed)
+    print(f"✅ Wrote {args.rows} rows in {files} chunk files under {os.path.join(args.root, 'output_chunks')}")
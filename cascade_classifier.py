@@ -0,0 +1,191 @@
+# cascade_classifier.py — cheap TF-IDF model answers confident rows, the zero-shot model gets the rest
+import argparse
+import os
+import random
+
+import numpy as np
+
+# CONFIG
+CASCADE_MODEL_PATH = "cascade_model.joblib"
+TRAIN_STEM = os.path.join("balanced_split_output", "train")  # high-confidence zero-shot labels (balance_and_split.py)
+VAL_STEM = os.path.join("balanced_split_output", "val")
+TARGET_AGREEMENT = 0.95  # threshold = lowest confidence where val rows at/above it agree this often with their label
+MIN_THRESHOLD = 0.5
+AUDIT_RATE = 0.02  # share of early-exit rows also sent to the full model to measure agreement
+SEED = 42
+
+
+def build_model():
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.pipeline import FeatureUnion, make_pipeline
+
+    features = FeatureUnion([
+        ("words", TfidfVectorizer(ngram_range=(1, 2), min_df=2, sublinear_tf=True)),
+        ("chars", TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), min_df=2, sublinear_tf=True)),
+    ])
+    return make_pipeline(features, LogisticRegression(C=10.0, max_iter=1000))
+
+
+def softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def fit_temperature(logits, targets):
+    """Temperature scaling: one scalar that minimizes validation log-loss → calibrated probabilities."""
+    from scipy.optimize import minimize_scalar
+
+    def nll(temperature):
+        probs = softmax(logits / temperature)
+        return -np.log(probs[np.arange(len(targets)), targets] + 1e-12).mean()
+
+    return float(minimize_scalar(nll, bounds=(0.05, 20.0), method="bounded").x)
+
+
+def choose_threshold(confidence, correct, target=TARGET_AGREEMENT):
+    """Lowest confidence t such that val rows with confidence >= t are correct at least `target` of the time."""
+    order = np.argsort(-confidence)
+    precision = np.cumsum(correct[order]) / np.arange(1, len(order) + 1)
+    ok = np.flatnonzero(precision >= target)
+    if not len(ok):
+        return 1.0
+    return max(MIN_THRESHOLD, float(confidence[order][ok[-1]]))
+
+
+def train_cascade_model(train_df, val_df, target=TARGET_AGREEMENT):
+    """Fit on train, calibrate + pick the early-exit threshold on val → model bundle dict."""
+    model = build_model()
+    model.fit(train_df["text"].astype(str), train_df["iab_label"].astype(str))
+    classes = list(model.classes_)
+
+    val_df = val_df[val_df["iab_label"].astype(str).isin(classes)]
+    targets = np.array([classes.index(label) for label in val_df["iab_label"].astype(str)])
+    logits = model.decision_function(val_df["text"].astype(str))
+    temperature = fit_temperature(logits, targets)
+
+    probs = softmax(logits / temperature)
+    confidence = probs.max(axis=1)
+    correct = probs.argmax(axis=1) == targets
+    threshold = choose_threshold(confidence, correct, target)
+    accepted = confidence >= threshold
+    report = {
+        "val_rows": int(len(val_df)),
+        "val_accuracy": float(correct.mean()),
+        "threshold": threshold,
+        "temperature": temperature,
+        "val_coverage": float(accepted.mean()),
+        "val_agreement_above_threshold": float(correct[accepted].mean()) if accepted.any() else 0.0,
+    }
+    return {"model": model, "classes": classes, "temperature": temperature, "threshold": threshold, "report": report}
+
+
+class CascadeClassifier:
+    """Two-stage labeler: the TF-IDF model answers rows it is confident about, the rest go to `fallback`.
+
+    zero_shot_engine.label_texts calls cascade_label() so the fallback still gets
+    token-budgeted batches of just the uncertain rows. A random AUDIT_RATE share of
+    early exits is also run through the fallback to track agreement.
+    """
+
+    def __init__(self, bundle, fallback, audit_rate=AUDIT_RATE, seed=SEED):
+        self.model = bundle["model"]
+        self.classes = bundle["classes"]
+        self.temperature = bundle["temperature"]
+        self.threshold = bundle["threshold"]
+        self.fallback = fallback
+        self.audit_rate = audit_rate
+        self.rng = random.Random(seed)
+
+    @classmethod
+    def load(cls, fallback, path=CASCADE_MODEL_PATH, **kwargs):
+        import joblib
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"❌ {path} not found → run `python cascade_classifier.py train` first.")
+        return cls(joblib.load(path), fallback, **kwargs)
+
+    @property
+    def tokenizer(self):
+        return self.fallback.tokenizer
+
+    def predict(self, texts, candidate_labels):
+        """Calibrated probabilities over candidate_labels (labels the model never saw get 0)."""
+        probs = softmax(self.model.decision_function(list(texts)) / self.temperature)
+        short = [label.split(" ", 1)[1] if label.startswith("IAB") else label for label in self.classes]
+        columns = [short.index(label) if label in short else -1 for label in candidate_labels]
+        scores = np.where(np.array(columns) >= 0, probs[:, columns], 0.0)
+        return scores / scores.sum(axis=1, keepdims=True).clip(min=1e-12)
+
+    def cascade_label(self, texts, candidate_labels, run_fallback, stats=None):
+        """Outputs for texts in order; run_fallback(texts) → full-model outputs for the rows passed on."""
+        scores = self.predict(texts, candidate_labels)
+        confident = scores.max(axis=1) >= self.threshold
+        audit = {i for i in np.flatnonzero(confident) if self.rng.random() < self.audit_rate}
+        passed_on = sorted(set(np.flatnonzero(~confident)) | audit)
+
+        outputs = [None] * len(texts)
+        for i in np.flatnonzero(confident):
+            order = np.argsort(-scores[i])
+            outputs[i] = {
+                "sequence": texts[i],
+                "labels": [candidate_labels[j] for j in order],
+                "scores": scores[i][order].tolist(),
+                "early_exit": True,  # not a full-model answer → kept out of the label cache
+            }
+
+        agreements = 0
+        for i, output in zip(passed_on, run_fallback([texts[i] for i in passed_on])):
+            if i in audit:
+                agreements += output["labels"][0] == outputs[i]["labels"][0]
+            outputs[i] = output
+
+        if stats is not None:
+            stats.cascade_rows += len(texts)
+            stats.early_exits += int(confident.sum()) - len(audit)
+            stats.audit_rows += len(audit)
+            stats.audit_agreements += agreements
+        return outputs
+
+    def __call__(self, sequences, candidate_labels, **kwargs):
+        single = isinstance(sequences, str)
+        texts = [sequences] if single else list(sequences)
+        outputs = self.cascade_label(texts, candidate_labels, lambda rest: self._fallback(rest, candidate_labels))
+        return outputs[0] if single else outputs
+
+    def _fallback(self, texts, candidate_labels):
+        if not texts:
+            return []
+        outputs = self.fallback(texts, candidate_labels)
+        return [outputs] if isinstance(outputs, dict) else outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the cheap first stage of the cascade labeling backend.")
+    parser.add_argument("command", choices=["train"])
+    parser.add_argument("--target-agreement", type=float, default=TARGET_AGREEMENT)
+    parser.add_argument("--output", default=CASCADE_MODEL_PATH)
+    args = parser.parse_args()
+
+    import joblib
+    from dataset_io import read_dataset
+
+    train_df = read_dataset(TRAIN_STEM, columns=["text", "iab_label"])
+    val_df = read_dataset(VAL_STEM, columns=["text", "iab_label"])
+    print(f"🧠 Training TF-IDF + logistic regression on {len(train_df)} rows ({len(val_df)} val rows)...")
+    bundle = train_cascade_model(train_df, val_df, target=args.target_agreement)
+    joblib.dump(bundle, args.output)
+
+    report = bundle["report"]
+    print(f"✅ Saved {args.output}")
+    print(f"→ Val accuracy {report['val_accuracy']:.1%} | early-exit threshold {report['threshold']:.3f} "
+          f"(temperature {report['temperature']:.2f})")
+    print(f"→ {report['val_coverage']:.1%} of val rows would skip the zero-shot model, "
+          f"agreeing {report['val_agreement_above_threshold']:.1%} with their label")
+    print("ℹ️ Val rows are high-confidence zero-shot labels; the audit sample while labeling "
+          "(or `python labeling_backends.py --backend cascade`) measures agreement on real input.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# charts.py — chart specs, parallel PNG rendering and skip-if-unchanged hashing
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")  # rendering happens in worker processes, no display
+import matplotlib.pyplot as plt
+import pandas as pd
+
+HASH_FILE_NAME = ".chart_hashes.json"  # stored next to the charts
+
+
+def word_frequencies(df, top_n=20):
+    """Top-N words per class in one pass: tokenize the whole text column once, count with one groupby."""
+    # Simple tokenizer → split on non-word characters
+    words = df["text"].astype(str).str.lower().str.findall(r"\b\w+\b")
+    exploded = pd.DataFrame({"iab_label": df["iab_label"].astype(str).to_numpy().repeat(words.str.len()),
+                             "word": [w for ws in words for w in ws]})
+    counts = exploded.groupby(["iab_label", "word"], sort=False).size().rename("count").reset_index()
+    counts = counts.sort_values(["iab_label", "count"], ascending=[True, False], kind="stable")
+    return counts.groupby("iab_label", sort=False).head(top_n)
+
+
+# Render functions take plain data so specs pickle cheaply to worker processes
+def render_bar(out_path, labels, values, title, ylabel, color=None):
+    ax = pd.DataFrame({"label": labels, "value": values}).plot.bar(x="label", y="value", legend=False, color=color)
+    ax.set_xlabel("iab_label")
+    plt.title(title)
+    plt.ylabel(ylabel)
+    plt.xticks(rotation=45, ha="right")
+    plt.tight_layout()
+    plt.savefig(out_path)
+    plt.close("all")
+
+
+def render_stacked(out_path, labels, columns, title, ylabel, colors):
+    pd.DataFrame(columns, index=pd.Index(labels, name="iab_label")).plot.bar(stacked=True, figsize=(12, 6), color=colors)
+    plt.title(title)
+    plt.ylabel(ylabel)
+    plt.xticks(rotation=45, ha="right")
+    plt.tight_layout()
+    plt.savefig(out_path)
+    plt.close("all")
+
+
+def render_words(out_path, words, counts, title):
+    plt.figure(figsize=(10, 6))
+    plt.bar(words, counts, color="skyblue")
+    plt.title(title)
+    plt.ylabel("Frequency")
+    plt.xticks(rotation=45, ha="right")
+    plt.tight_layout()
+    plt.savefig(out_path)
+    plt.close("all")
+
+
+RENDERERS = {"bar": render_bar, "stacked": render_stacked, "words": render_words}
+
+
+def chart(kind, out_path, **data):
+    return {"kind": kind, "out_path": out_path, "data": data}
+
+
+def chart_hash(spec):
+    payload = json.dumps([spec["kind"], spec["data"]], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _render(spec):
+    RENDERERS[spec["kind"]](spec["out_path"], **spec["data"])
+    return spec["out_path"]
+
+
+def render_charts(specs, executor=None):
+    """Render chart specs, skipping PNGs whose input data hash is unchanged since the last run.
+
+    Specs are spread over `executor` (a process pool) when given. Returns
+    (rendered paths, skipped paths).
+    """
+    by_folder = {}
+    for spec in specs:
+        by_folder.setdefault(os.path.dirname(spec["out_path"]), []).append(spec)
+
+    rendered, skipped = [], []
+    for folder, folder_specs in by_folder.items():
+        hash_file = os.path.join(folder, HASH_FILE_NAME)
+        hashes = {}
+        if os.path.exists(hash_file):
+            with open(hash_file, "r") as f:
+                hashes = json.load(f)
+
+        todo = []
+        for spec in folder_specs:
+            name = os.path.basename(spec["out_path"])
+            digest = chart_hash(spec)
+            if hashes.get(name) == digest and os.path.exists(spec["out_path"]):
+                skipped.append(spec["out_path"])
+            else:
+                todo.append((name, digest, spec))
+
+        results = executor.map(_render, [spec for _, _, spec in todo]) if executor else map(_render, [s for _, _, s in todo])
+        for (name, digest, _), out_path in zip(todo, results):
+            hashes[name] = digest
+            rendered.append(out_path)
+
+        with open(hash_file, "w") as f:
+            json.dump(hashes, f, indent=2, sort_keys=True)
+    return rendered, skipped
+
+
+def chart_pool(max_workers=None):
+    return ProcessPoolExecutor(max_workers=max_workers)
@@ -0,0 +1,74 @@
+# dataset_io.py — columnar (Parquet) or CSV storage for the combined dataset and splits
+import os
+
+import pandas as pd
+
+# CONFIG
+STORAGE_FORMAT = "parquet"  # "parquet" (needs pyarrow) or "csv"
+EXPORT_CSV = True  # with parquet, also write a .csv copy next to each dataset (old consumers / manual review)
+CATEGORICAL_COLUMNS = ["iab_label", "source"]
+
+
+def dataset_path(stem, fmt=None):
+    fmt = fmt or STORAGE_FORMAT
+    return f"{stem}.{'parquet' if fmt == 'parquet' else 'csv'}"
+
+
+def dataset_files(stem):
+    # Every file write_dataset produces for stem
+    paths = [dataset_path(stem)]
+    if STORAGE_FORMAT == "parquet" and EXPORT_CSV:
+        paths.append(dataset_path(stem, "csv"))
+    return paths
+
+
+def dataset_exists(stem):
+    return os.path.exists(dataset_path(stem)) or os.path.exists(dataset_path(stem, "csv"))
+
+
+def optimize_dtypes(df):
+    # Low-cardinality labels → categorical, confidence → float32
+    df = df.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    if "confidence" in df.columns:
+        df["confidence"] = df["confidence"].astype("float32")
+    return df
+
+
+def to_csv_frame(df):
+    # float32 values (even once widened by a concat) print as 0.8999999761581421 → round back
+    floats = [c for c in df.columns if pd.api.types.is_float_dtype(df[c])]
+    return df.astype({c: "float64" for c in floats}).round({c: 6 for c in floats}) if floats else df
+
+
+def write_dataset(df, stem, export_csv=None):
+    """Write df as <stem>.parquet (+ optional <stem>.csv) or <stem>.csv; returns the primary path."""
+    from labeling_manifest import write_atomic
+
+    export_csv = EXPORT_CSV if export_csv is None else export_csv
+    path = dataset_path(stem)
+    if STORAGE_FORMAT == "parquet":
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        optimize_dtypes(df).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    if STORAGE_FORMAT != "parquet" or export_csv:
+        write_atomic(dataset_path(stem, "csv"), lambda f: to_csv_frame(df).to_csv(f, index=False))
+    return path
+
+
+def read_dataset(stem, columns=None):
+    """Read <stem> in the configured format (falling back to CSV), loading only `columns`."""
+    path = dataset_path(stem)
+    if STORAGE_FORMAT == "parquet" and os.path.exists(path):
+        if columns is not None:
+            import pyarrow.parquet as pq
+
+            available = pq.read_schema(path).names  # footer only, no data read
+            columns = [c for c in columns if c in available]
+        return pd.read_parquet(path, columns=columns)
+
+    csv_path = dataset_path(stem, "csv")
+    usecols = None if columns is None else (lambda c: c in columns)
+    return optimize_dtypes(pd.read_csv(csv_path, usecols=usecols))
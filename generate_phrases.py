@@ -1,76 +1,212 @@
 import os
 import json
 import csv
+import random
+import asyncio
+import argparse
+import time
 from pathlib import Path
 from dotenv import load_dotenv
-from openai import OpenAI
-
-print("🚀 Script started")
-
-# Load environment variables from .env (optional)
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise EnvironmentError("❌ OPENAI_API_KEY not set in environment variables.")
-
-# OpenAI client (v1+)
-client = OpenAI(api_key=api_key)
-
-# Load IAB categories
-with open("iab_categories.json", "r") as f:
-    iab_categories = json.load(f)
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
+from labeling_manifest import write_atomic
 
 # Output directory
-output_dir = Path("output_chunks/output_chunks_synthetic_GPT35")
-output_dir.mkdir(parents=True, exist_ok=True)
+OUTPUT_DIR = Path("output_chunks/output_chunks_synthetic_GPT35")
 
 # Generation config
+MODEL = "gpt-3.5-turbo"
 TEMPERATURE = 0.8
 MAX_TOKENS = 60
 NUM_QUERIES = 10
 CONFIDENCE = 0.85
 
+# Concurrency / rate limits (requests and tokens per minute, as on the API's rate-limit page)
+CONCURRENCY = 8  # requests in flight at once; 1 → one subcategory after another
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 60000
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0  # seconds; attempt n waits uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**n))
+BACKOFF_MAX = 30.0
+RETRY_STATUS = {408, 409, 429}  # + every 5xx
+
 # Prompt template
 PROMPT_TEMPLATE = (
     "Generate a list of short, realistic search queries (2–5 words) someone might type online. "
     "Topic: {label}. Start each query with the actual query only—no bullets or numbering."
 )
+SYSTEM_PROMPT = "You are an expert at writing search queries."
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute up to one minute's worth; acquire() waits for enough units."""
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        async with self.lock:  # first come, first served
+            while True:
+                now = time.monotonic()
+                self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.rate)
+
+
+def iter_subcategories(iab_categories):
+    # iab_categories.json: {"IAB1": {"name": ..., "subcategories": [{"code", "name"}]}} (older files: "children" dict)
+    for parent_code, parent_data in iab_categories.items():
+        children = parent_data.get("children") or {c["code"]: c["name"] for c in parent_data.get("subcategories", [])}
+        for sub_code, sub_label in children.items():
+            yield parent_code, sub_code, sub_label
+
+
+def output_path(sub_code, sub_label):
+    label = sub_label.replace(" ", "_").replace("&", "and").replace("/", "_")
+    return OUTPUT_DIR / f"labeled_batch_{sub_code.replace('-', '_')}_{label}.csv"
+
+
+def parse_queries(content):
+    text = content.strip().split("\n")
+    return [line.strip("•-1234567890. ").strip() for line in text if line.strip()]
+
+
+def is_retryable(error):
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code in RETRY_STATUS or error.status_code >= 500)
+
 
-def generate_queries(iab_code, label):
+def backoff_delay(error, attempt):
+    # Server-sent Retry-After wins; otherwise exponential backoff with full jitter
+    retry_after = None
+    if isinstance(error, APIStatusError):
+        retry_after = error.response.headers.get("retry-after")
     try:
+        return min(BACKOFF_MAX, float(retry_after))
+    except (TypeError, ValueError):
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class Generator:
+    def __init__(self, client, concurrency=CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE,
+                 tokens_per_minute=TOKENS_PER_MINUTE):
+        self.client = client
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.retries = 0
+
+    async def generate_queries(self, iab_code, label):
         prompt = PROMPT_TEMPLATE.format(label=label)
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an expert at writing search queries."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS
-        )
-
-        text = response.choices[0].message.content.strip().split("\n")
-        queries = [line.strip("•-1234567890. ").strip() for line in text if line.strip()]
-        return queries
-    except Exception as e:
-        print(f"❌ Error generating for {iab_code}-{label}: {e}")
-        return []
-
-# Loop through IAB hierarchy
-for parent_code, parent_data in iab_categories.items():
-    parent_label = parent_data.get("name", "")
-    for sub_code, sub_label in parent_data.get("children", {}).items():
+        # Rough token budget: ~4 characters per prompt token + the completion cap
+        estimated_tokens = (len(SYSTEM_PROMPT) + len(prompt)) // 4 + MAX_TOKENS
+        for attempt in range(MAX_RETRIES + 1):
+            async with self.semaphore:
+                await self.request_bucket.acquire()
+                await self.token_bucket.acquire(estimated_tokens)
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=MODEL,
+                        messages=[
+                            {"role": "system", "content": SYSTEM_PROMPT},
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=TEMPERATURE,
+                        max_tokens=MAX_TOKENS
+                    )
+                    return parse_queries(response.choices[0].message.content or "")
+                except Exception as e:
+                    if not is_retryable(e) or attempt == MAX_RETRIES:
+                        print(f"❌ Error generating for {iab_code}-{label}: {e}")
+                        return None
+                    error = e
+            # Back off outside the semaphore so other subcategories keep going
+            self.retries += 1
+            delay = backoff_delay(error, attempt)
+            print(f"🔁 {iab_code} retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s ({error.__class__.__name__})")
+            await asyncio.sleep(delay)
+
+    async def generate_subcategory(self, parent_code, sub_code, sub_label):
+        """Generate and save one subcategory → "saved" | "empty" | "failed"."""
         print(f"🧠 Generating queries for {sub_code} — {sub_label}")
-        queries = generate_queries(sub_code, sub_label)
+        queries = await self.generate_queries(sub_code, sub_label)
+        if queries is None:
+            return "failed"
         if not queries:
             print(f"⚠️ No queries for {sub_code} - {sub_label}")
-            continue
+            return "empty"
 
-        filename = f"labeled_batch_{sub_code.replace('-', '_')}_{sub_label.replace(' ', '_').replace('&', 'and')}.csv"
-        output_file = output_dir / filename
-        with output_file.open("w", newline='') as csvfile:
+        # Whole file or nothing → an interrupted run never leaves a half-written subcategory behind
+        def write_rows(csvfile):
             writer = csv.writer(csvfile)
             writer.writerow(["text", "iab_label", "confidence"])
             for query in queries:
                 writer.writerow([query, parent_code, CONFIDENCE])
+
+        output_file = output_path(sub_code, sub_label)
+        write_atomic(output_file, write_rows)
         print(f"✅ Saved: {output_file.name} with {len(queries)} queries")
+        return "saved"
+
+
+async def generate_all(iab_categories, client, **limits):
+    """Generate every subcategory that has no output file yet; returns {status: count}."""
+    todo = [sub for sub in iter_subcategories(iab_categories) if not output_path(sub[1], sub[2]).exists()]
+    total = sum(1 for _ in iter_subcategories(iab_categories))
+    print(f"⏩ {total - len(todo)} of {total} subcategories already generated → skipped")
+
+    generator = Generator(client, **limits)
+    statuses = await asyncio.gather(*(generator.generate_subcategory(*sub) for sub in todo))
+    counts = {status: statuses.count(status) for status in ["saved", "empty", "failed"]}
+    counts["skipped"] = total - len(todo)
+    counts["retries"] = generator.retries
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic search queries per IAB subcategory.")
+    parser.add_argument("--base-url", default=None, help="API base URL (default: OPENAI_BASE_URL or api.openai.com)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE, help="requests per minute")
+    parser.add_argument("--tpm", type=int, default=TOKENS_PER_MINUTE, help="tokens per minute")
+    args = parser.parse_args()
+
+    print("🚀 Script started")
+
+    # Load environment variables from .env (optional)
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise EnvironmentError("❌ OPENAI_API_KEY not set in environment variables.")
+
+    # Load IAB categories
+    with open("iab_categories.json", "r") as f:
+        iab_categories = json.load(f)
+
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    async def run():
+        # OpenAI client (v1+); retries are handled here, with backoff shared across requests
+        base_url = args.base_url or os.getenv("OPENAI_BASE_URL")
+        async with AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0) as client:
+            return await generate_all(iab_categories, client, concurrency=args.concurrency,
+                                      requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+
+    start = time.perf_counter()
+    counts = asyncio.run(run())
+    print(f"\n🏁 Done in {time.perf_counter() - start:.1f}s → {counts['saved']} saved, {counts['skipped']} skipped, "
+          f"{counts['empty']} empty, {counts['failed']} failed ({counts['retries']} retries)")
+    if counts["failed"]:
+        print("⚠️ Re-run the script to retry the failed subcategories (finished ones are skipped).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+# iab_labels.py — IAB tier-1 labels shared by the labeling scripts
+
+# IAB labels
+iab_labels = [
+    "IAB1 Arts & Entertainment", "IAB2 Automotive", "IAB3 Business", "IAB4 Careers",
+    "IAB5 Education", "IAB6 Family & Parenting", "IAB7 Health & Fitness", "IAB8 Food & Drink",
+    "IAB9 Hobbies & Interests", "IAB10 Home & Garden", "IAB11 Law, Gov’t & Politics",
+    "IAB12 News", "IAB13 Personal Finance", "IAB14 Society", "IAB15 Science", "IAB16 Pets",
+    "IAB17 Sports", "IAB18 Style & Fashion", "IAB19 Technology & Computing", "IAB20 Travel",
+    "IAB21 Real Estate", "IAB22 Shopping", "IAB23 Religion & Spirituality", "IAB24 Uncategorized"
+]
+
+# Candidate labels (cleaned for model)
+candidate_labels = [label.split(" ", 1)[1] for label in iab_labels]
+
+
+def to_full_label(candidate_label):
+    # Map back to full IAB label
+    return next(iab for iab in iab_labels if iab.endswith(candidate_label))
@@ -0,0 +1,186 @@
+# instrumentation.py — timing spans (rows, rows/sec, memory high-water mark) written to a JSONL trace
+#
+#   PIPELINE_TRACE=pipeline_trace.jsonl python run_full_pipeline.py   # off unless set; the file is appended to
+#   PIPELINE_PROFILE=1 python balance_and_split.py                    # + cProfile of the whole script → profiles/*.prof
+#   python instrumentation.py summary pipeline_trace.jsonl            # per-span totals (last run)
+#
+# py-spy needs nothing from here (`py-spy record -o flame.svg -- python train.py`); every trace line
+# carries pid and thread id so sampled stacks can be lined up with spans.
+import argparse
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows → no ru_maxrss
+    resource = None
+
+# CONFIG
+TRACE_FILE = os.getenv("PIPELINE_TRACE", "")  # opt-in: train.py writes a line per forward sub-batch
+PROFILE = os.getenv("PIPELINE_PROFILE", "") not in ("", "0")
+PROFILE_DIR = os.getenv("PIPELINE_PROFILE_DIR", "profiles")
+PROFILE_TOP = 25  # functions printed from each profile (by cumulative time)
+
+RUN_ID = os.getenv("PIPELINE_RUN_ID") or uuid.uuid4().hex[:12]
+os.environ["PIPELINE_RUN_ID"] = RUN_ID  # child processes (chart pool, labeling workers) join the same run
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_trace = None
+
+
+def max_rss_mb():
+    """Peak resident memory of this process so far (ru_maxrss is KB on Linux, bytes on macOS)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def write_record(record):
+    global _trace
+    if not TRACE_FILE:
+        return
+    line = json.dumps(record, default=str) + "\n"
+    with _write_lock:
+        if _trace is None:
+            _trace = open(TRACE_FILE, "a", encoding="utf-8", buffering=1)
+        _trace.write(line)  # one short line per write → appends from several processes don't interleave
+
+
+class Span:
+    """Mutable handle yielded by span(): set .rows (or add attributes) once they are known."""
+
+    def __init__(self, name, rows=None, attrs=None):
+        self.name = name
+        self.rows = rows
+        self.attrs = attrs or {}
+        self.id = uuid.uuid4().hex[:8]
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def span(name, rows=None, **attrs):
+    """Time a block → one trace line with seconds, rows/sec, current and peak RSS; spans nest per thread."""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    current = Span(name, rows, attrs)
+    parent = stack[-1].id if stack else None
+    stack.append(current)
+    started_at = time.time()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield current
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        rss, peak = rss_mb(), max_rss_mb()
+        write_record({
+            "run": RUN_ID,
+            "span": current.id,
+            "parent": parent,
+            "name": name,
+            "start": round(started_at, 6),
+            "seconds": round(seconds, 6),
+            "rows": current.rows,
+            "rows_per_sec": round(current.rows / seconds, 1) if current.rows and seconds > 0 else None,
+            "rss_mb": rss,
+            "max_rss_mb": max(peak, rss) if peak is not None and rss is not None else peak,
+            "pid": os.getpid(),
+            "thread": threading.get_ident(),
+            "status": status,
+            **current.attrs,
+        })
+
+
+def traced(name):
+    """Decorator form of span() for functions that are a step on their own."""
+    def decorate(fn):
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+    return decorate
+
+
+def run_main(main, name):
+    """Script entry point: main() inside a top-level span; with PIPELINE_PROFILE also under cProfile."""
+    if not PROFILE:
+        with span(name):
+            return main()
+
+    profiler = cProfile.Profile()
+    try:
+        with span(name, profile=True):
+            return profiler.runcall(main)
+    finally:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        out_path = os.path.join(PROFILE_DIR, f"{name}.prof")
+        profiler.dump_stats(out_path)
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        print(text.getvalue())
+        print(f"🔬 Profile saved to {out_path} (open with snakeviz or `python -m pstats {out_path}`)")
+
+
+def summarize(trace_file, run=None):
+    """Aggregate a trace by span name → list of dicts, slowest total first (last run unless `run` given)."""
+    with open(trace_file, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        return []
+    run = run or records[-1]["run"]
+
+    totals = {}
+    for r in records:
+        if r["run"] != run:
+            continue
+        t = totals.setdefault(r["name"], {"name": r["name"], "count": 0, "seconds": 0.0, "rows": 0, "max_rss_mb": 0.0})
+        t["count"] += 1
+        t["seconds"] += r["seconds"]
+        t["rows"] += r["rows"] or 0
+        t["max_rss_mb"] = max(t["max_rss_mb"], r["max_rss_mb"] or 0.0)
+    for t in totals.values():
+        t["rows_per_sec"] = t["rows"] / t["seconds"] if t["rows"] and t["seconds"] else None
+    return sorted(totals.values(), key=lambda t: -t["seconds"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a pipeline trace file.")
+    parser.add_argument("command", choices=["summary"])
+    parser.add_argument("trace_file", nargs="?", default=TRACE_FILE or "pipeline_trace.jsonl")
+    parser.add_argument("--run", help="run id (default: the last run in the file)")
+    args = parser.parse_args()
+
+    print(f"{'span':<32} {'count':>6} {'total s':>10} {'rows':>12} {'rows/s':>12} {'peak MB':>9}")
+    for t in summarize(args.trace_file, args.run):
+        rate = f"{t['rows_per_sec']:,.0f}" if t["rows_per_sec"] else "-"
+        print(f"{t['name']:<32} {t['count']:>6} {t['seconds']:>10.2f} {t['rows']:>12} {rate:>12} {t['max_rss_mb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
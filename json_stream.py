@@ -0,0 +1,101 @@
+# json_stream.py — incremental reader for train_text_only_*.json (JSON array or JSONL)
+import codecs
+import json
+
+CHUNK_SIZE = 1 << 20  # bytes read per refill
+
+
+class JsonRecordReader:
+    """Iterate records of a JSON array or JSONL file without loading the whole file.
+
+    tell() returns the byte offset just past the last record yielded; passing it
+    back as start_offset resumes reading at the next record.
+    """
+
+    def __init__(self, path, start_offset=None, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        with open(path, "rb") as f:
+            head = f.read(1)
+        self.is_array = head == b"["
+        # Byte offset of the first record: just inside "[" for arrays, 0 for JSONL
+        self.start_offset = start_offset if start_offset is not None else (1 if self.is_array else 0)
+        self._offset = self.start_offset
+
+    def tell(self):
+        return self._offset
+
+    def __iter__(self):
+        return self._iter_array() if self.is_array else self._iter_lines()
+
+    def _iter_lines(self):
+        with open(self.path, "rb") as f:
+            f.seek(self.start_offset)
+            for line in iter(f.readline, b""):
+                self._offset += len(line)
+                if line.strip():
+                    yield json.loads(line)
+
+    def _iter_array(self):
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder("utf-8")()
+        with open(self.path, "rb") as f:
+            f.seek(self.start_offset)
+            buf, pos, eof = "", 0, False
+            # self._offset is the byte offset of buf[mark]
+            mark = 0
+
+            while True:
+                # Skip separators, refilling the buffer as needed
+                while True:
+                    while pos < len(buf) and buf[pos] in " \t\r\n,":
+                        pos += 1
+                    if pos < len(buf) or eof:
+                        break
+                    chunk = f.read(self.chunk_size)
+                    eof = not chunk
+                    buf += utf8.decode(chunk, final=eof)
+
+                if pos >= len(buf) or buf[pos] == "]":
+                    return
+
+                try:
+                    record, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    chunk = f.read(self.chunk_size)
+                    eof = not chunk
+                    buf += utf8.decode(chunk, final=eof)
+                    continue
+
+                pos = end
+                self._offset += len(buf[mark:pos].encode("utf-8"))
+                mark = pos
+                # Drop consumed text so the buffer stays around one chunk
+                if mark > self.chunk_size:
+                    buf, pos, mark = buf[mark:], 0, 0
+                yield record
+
+
+def iter_text_batches(path, batch_size, start_row=0, start_offset=None, max_rows=None, text_key="text"):
+    """Yield (start_row, texts, next_offset) batches of the text_key field.
+
+    start_row / start_offset resume mid-file (the offset must be one returned as
+    next_offset for that row). Rows from max_rows on are never yielded: the last
+    batch is cut short there.
+    """
+    if max_rows is not None and start_row >= max_rows:
+        return
+    reader = JsonRecordReader(path, start_offset=start_offset)
+    batch, batch_start = [], start_row
+    for record in reader:
+        batch.append(record.get(text_key))
+        if len(batch) == batch_size or (max_rows is not None and batch_start + len(batch) >= max_rows):
+            yield batch_start, batch, reader.tell()
+            batch_start += len(batch)
+            batch = []
+            if max_rows is not None and batch_start >= max_rows:
+                return
+    if batch:
+        yield batch_start, batch, reader.tell()
@@ -0,0 +1,74 @@
+# label_cache.py — persistent zero-shot label cache keyed by normalized-text hash
+import hashlib
+import json
+import re
+import sqlite3
+import unicodedata
+
+
+def normalize_text(text):
+    # Same query modulo case / Unicode form / surrounding or repeated whitespace → same key
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def text_key(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def namespace_key(model_name, candidate_labels, hypothesis_template):
+    # Results are only reusable for the same model, label set and hypothesis wording
+    payload = json.dumps([model_name, list(candidate_labels), hypothesis_template])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class LabelCache:
+    """SQLite-backed cache of zero-shot outputs, shared by runs, input files and worker processes.
+
+    Each entry stores the score for every candidate label (in candidate_labels
+    order), so cached rows rebuild the same output dict the pipeline returns.
+    """
+
+    def __init__(self, path, model_name, candidate_labels, hypothesis_template):
+        self.path = path
+        self.candidate_labels = list(candidate_labels)
+        self.namespace = namespace_key(model_name, candidate_labels, hypothesis_template)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            " namespace TEXT NOT NULL, text_hash TEXT NOT NULL, scores TEXT NOT NULL,"
+            " PRIMARY KEY (namespace, text_hash))"
+        )
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """keys → {key: output dict} for the keys that are cached."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), 500):  # stay under SQLite's bound-parameter limit
+            chunk = unique[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT text_hash, scores FROM labels WHERE namespace = ? AND text_hash IN ({','.join('?' * len(chunk))})",
+                [self.namespace, *chunk],
+            )
+            for key, scores in rows:
+                found[key] = self._to_output(json.loads(scores))
+        return found
+
+    def put_many(self, items):
+        """items: iterable of (key, pipeline output dict)."""
+        rows = []
+        for key, output in items:
+            by_label = dict(zip(output["labels"], output["scores"]))
+            scores = [by_label[label] for label in self.candidate_labels]
+            rows.append((self.namespace, key, json.dumps(scores)))
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO labels VALUES (?, ?, ?)", rows)
+
+    def _to_output(self, scores):
+        ranked = sorted(zip(self.candidate_labels, scores), key=lambda pair: pair[1], reverse=True)
+        return {"labels": [label for label, _ in ranked], "scores": [score for _, score in ranked]}
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,308 @@
+# labeling_backends.py — selectable zero-shot labeling backends for train.py
+import argparse
+import glob
+import os
+import random
+
+import numpy as np
+
+from iab_labels import candidate_labels
+from json_stream import JsonRecordReader
+from zero_shot_engine import HYPOTHESIS_TEMPLATE, ThroughputStats, label_texts
+
+ZERO_SHOT_MODEL = "facebook/bart-large-mnli"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_TEMPERATURE = 0.05  # softmax temperature over cosine similarities
+CASCADE_FALLBACK = "pipeline"  # full model behind the cascade's cheap first stage (cascade_classifier.py)
+QUANTIZED_THREADS = None  # torch threads for the int8 backend; None → torch default (sharded workers set their own)
+ONNX_DIR = "onnx_models"  # exported graphs, one folder per model (exported on first use)
+ONNX_QUANTIZE = False  # True → run an int8-quantized copy of the exported graph (onnxruntime.quantization)
+ORT_INTRA_OP_THREADS = None  # threads inside one operator (the matmuls); None → every core this process may use
+ORT_INTER_OP_THREADS = 1  # independent operators run in parallel; the encoder-decoder graph is one long chain
+
+
+class EmbeddingZeroShotClassifier:
+    """Zero-shot scorer that encodes each premise once and compares it with every label.
+
+    The NLI pipeline runs the encoder on (text, hypothesis) once per candidate label;
+    here the premise and the 24 hypotheses are embedded separately (hypotheses once per
+    label set) and scored by cosine similarity. Calls and outputs mirror the
+    "zero-shot-classification" pipeline so it drops into zero_shot_engine.label_texts.
+    """
+
+    pairs_per_text = 1  # one encoder pass per premise, whatever the number of labels
+
+    def __init__(self, model_name=EMBEDDING_MODEL, device=-1, temperature=EMBEDDING_TEMPERATURE):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self.torch = torch
+        self.device = torch.device("cpu" if device is None or device < 0 else f"cuda:{device}")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).to(self.device).eval()
+        self.temperature = temperature
+        self._label_embeddings = {}
+
+    def _encode(self, texts):
+        torch = self.torch
+        inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors="pt").to(self.device)
+        with torch.inference_mode():
+            hidden = self.model(**inputs).last_hidden_state
+
+        # Mean pooling over real tokens, then L2-normalize → dot product = cosine similarity
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return torch.nn.functional.normalize(pooled, dim=-1)
+
+    def label_embeddings(self, candidate_labels, hypothesis_template=HYPOTHESIS_TEMPLATE):
+        key = (tuple(candidate_labels), hypothesis_template)
+        if key not in self._label_embeddings:
+            hypotheses = [hypothesis_template.format(label) for label in candidate_labels]
+            self._label_embeddings[key] = self._encode(hypotheses)
+        return self._label_embeddings[key]
+
+    def __call__(self, sequences, candidate_labels, hypothesis_template=HYPOTHESIS_TEMPLATE, **kwargs):
+        single = isinstance(sequences, str)
+        texts = [sequences] if single else list(sequences)
+
+        labels_emb = self.label_embeddings(candidate_labels, hypothesis_template)
+        probs = ((self._encode(texts) @ labels_emb.T) / self.temperature).softmax(dim=-1).cpu().tolist()
+
+        outputs = []
+        for text, row in zip(texts, probs):
+            ranked = sorted(zip(candidate_labels, row), key=lambda pair: pair[1], reverse=True)
+            outputs.append({
+                "sequence": text,
+                "labels": [label for label, _ in ranked],
+                "scores": [score for _, score in ranked],
+            })
+        return outputs[0] if single else outputs
+
+
+class NLIZeroShotClassifier:
+    """The zero-shot pipeline's scoring on top of a bare NLI forward function (int8 torch model, ONNX session).
+
+    All (text, hypothesis) pairs of a call are tokenized together (only the text is
+    truncated, as in the pipeline) and run as one batch; the entailment logits are
+    softmaxed over the candidate labels. forward(dict of int64 arrays) → logits array.
+    """
+
+    def __init__(self, tokenizer, forward, entailment_id):
+        self.tokenizer = tokenizer
+        self.forward = forward
+        self.entailment_id = entailment_id
+
+    def __call__(self, sequences, candidate_labels, hypothesis_template=HYPOTHESIS_TEMPLATE, **kwargs):
+        single = isinstance(sequences, str)
+        texts = [sequences] if single else list(sequences)
+
+        hypotheses = [hypothesis_template.format(label) for label in candidate_labels]
+        inputs = self.tokenizer([t for t in texts for _ in hypotheses], hypotheses * len(texts), padding=True,
+                                truncation="only_first", return_tensors="np")
+        logits = self.forward({name: inputs[name].astype(np.int64) for name in self.tokenizer.model_input_names
+                               if name in inputs})
+        entail = logits[:, self.entailment_id].reshape(len(texts), len(candidate_labels)).astype(np.float64)
+        scores = np.exp(entail - entail.max(axis=1, keepdims=True))
+        scores /= scores.sum(axis=1, keepdims=True)
+
+        outputs = []
+        for text, row in zip(texts, scores):
+            order = row.argsort()[::-1]  # same ordering as the pipeline's postprocess
+            outputs.append({
+                "sequence": text,
+                "labels": [candidate_labels[i] for i in order],
+                "scores": row[order].tolist(),
+            })
+        return outputs[0] if single else outputs
+
+
+def default_device():
+    """0 (first GPU) when CUDA is available, else -1 (CPU)."""
+    try:
+        import torch
+    except ImportError:
+        return -1
+    return 0 if torch.cuda.is_available() else -1
+
+
+def available_cores():
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def entailment_id(model_name):
+    from transformers import AutoConfig
+
+    label2id = AutoConfig.from_pretrained(model_name).label2id
+    ids = [i for label, i in label2id.items() if label.lower().startswith("entail")]
+    if not ids:
+        raise ValueError(f"❌ {model_name} has no 'entailment' label in its config → not an NLI model")
+    return ids[0]
+
+
+def load_quantized_classifier(model_name=ZERO_SHOT_MODEL, threads=QUANTIZED_THREADS):
+    """NLI model with every Linear layer dynamically quantized to int8 (CPU only)."""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    if threads:
+        torch.set_num_threads(threads)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def forward(inputs):
+        with torch.inference_mode():
+            return model(**{k: torch.from_numpy(v) for k, v in inputs.items()}).logits.float().numpy()
+
+    return NLIZeroShotClassifier(tokenizer, forward, entailment_id(model_name))
+
+
+def export_onnx(model_name=ZERO_SHOT_MODEL, onnx_dir=ONNX_DIR, quantize=None):
+    """Export the NLI model to <onnx_dir>/<model>/model.onnx once (+ model.int8.onnx) → path to run."""
+    quantize = ONNX_QUANTIZE if quantize is None else quantize  # read at call time, like backend_model_name
+    folder = os.path.join(onnx_dir, model_name.strip("/").replace("/", "--"))
+    path = os.path.join(folder, "model.onnx")
+    if not os.path.exists(path):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+        sample = tokenizer(["best pizza near me"], ["This example is Food & Drink."], return_tensors="pt")
+        names = [name for name in tokenizer.model_input_names if name in sample]
+
+        class LogitsOnly(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *args):
+                return self.model(**dict(zip(names, args))).logits
+
+        print(f"📦 Exporting {model_name} to ONNX → {path} (one-time)")
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        torch.onnx.export(
+            LogitsOnly(), tuple(sample[name] for name in names), tmp_path,
+            input_names=names, output_names=["logits"], opset_version=17, dynamo=False,
+            dynamic_axes={**{name: {0: "pairs", 1: "tokens"} for name in names}, "logits": {0: "pairs"}},
+        )
+        os.replace(tmp_path, path)
+
+    if not quantize:
+        return path
+    int8_path = os.path.join(folder, "model.int8.onnx")
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"📦 Quantizing {path} to int8 → {int8_path} (one-time)")
+        tmp_path = f"{int8_path}.tmp-{os.getpid()}"
+        quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)  # an interrupted run never leaves a truncated model.int8.onnx behind
+    return int8_path
+
+
+def load_onnx_classifier(model_name=ZERO_SHOT_MODEL):
+    """NLI model exported to ONNX, run by onnxruntime on CPU with tuned thread pools."""
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = ORT_INTRA_OP_THREADS or available_cores()
+    options.inter_op_num_threads = ORT_INTER_OP_THREADS
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(export_onnx(model_name), options, providers=["CPUExecutionProvider"])
+    input_names = {i.name for i in session.get_inputs()}
+
+    def forward(inputs):
+        return session.run(["logits"], {k: v for k, v in inputs.items() if k in input_names})[0]
+
+    return NLIZeroShotClassifier(AutoTokenizer.from_pretrained(model_name), forward, entailment_id(model_name))
+
+
+def backend_model_name(backend):
+    """Identity of the model behind a backend (keys the label cache)."""
+    if backend == "cascade":
+        return backend_model_name(CASCADE_FALLBACK)  # only full-model answers are cached
+    models = {"pipeline": ZERO_SHOT_MODEL, "embedding": EMBEDDING_MODEL, "quantized": ZERO_SHOT_MODEL,
+              "onnx": ZERO_SHOT_MODEL + (":int8" if ONNX_QUANTIZE else "")}
+    return f"{backend}:{models[backend]}"
+
+
+def load_classifier(backend="pipeline", device=None):
+    """Build the classifier used by train.py.
+
+    backend: "pipeline" | "embedding" | "cascade" | "quantized" | "onnx" (the last two
+    always run on CPU). device: GPU index, -1 for CPU, None → GPU if available.
+    """
+    device = default_device() if device is None else device
+    if backend == "pipeline":
+        from transformers import pipeline
+        return pipeline("zero-shot-classification", model=ZERO_SHOT_MODEL, device=device)
+    if backend == "embedding":
+        return EmbeddingZeroShotClassifier(device=device)
+    if backend == "quantized":
+        return load_quantized_classifier()
+    if backend == "onnx":
+        return load_onnx_classifier()
+    if backend == "cascade":
+        from cascade_classifier import CascadeClassifier
+        return CascadeClassifier.load(load_classifier(CASCADE_FALLBACK, device=device))
+    raise ValueError(f"Unknown labeling backend: {backend!r}")
+
+
+def check_agreement(reference, candidate, texts, candidate_labels):
+    """Compare top-1 labels (and top-1 confidence) of two classifiers on the same texts."""
+    texts = [t for t in texts if isinstance(t, str) and t.strip() != ""]
+    ref_outputs = label_texts(reference, texts, candidate_labels)
+    candidate_stats = ThroughputStats()
+    cand_outputs = label_texts(candidate, texts, candidate_labels, stats=candidate_stats)
+
+    matches = sum(r["labels"][0] == c["labels"][0] for r, c in zip(ref_outputs, cand_outputs))
+    conf_diff = sum(abs(r["scores"][0] - c["scores"][0]) for r, c in zip(ref_outputs, cand_outputs))
+    return {
+        "rows": len(texts),
+        "top1_agreement": matches / len(texts) if texts else 0.0,
+        "mean_abs_confidence_diff": conf_diff / len(texts) if texts else 0.0,
+        "candidate_stats": candidate_stats,
+    }
+
+
+def sample_training_texts(training_folder, sample_size, seed=42):
+    """Uniform sample of texts across the input files, streamed → memory bounded by sample_size."""
+    rng = random.Random(seed)
+    sample, seen = [], 0
+    for input_file in sorted(glob.glob(os.path.join(training_folder, "train_text_only_*.json"))):
+        for record in JsonRecordReader(input_file):
+            # Reservoir sampling: the n-th text replaces a kept one with probability sample_size / n
+            if len(sample) < sample_size:
+                sample.append(record.get("text"))
+            else:
+                slot = rng.randrange(seen + 1)
+                if slot < sample_size:
+                    sample[slot] = record.get("text")
+            seen += 1
+    rng.shuffle(sample)
+    return sample
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check a labeling backend against the reference BART-MNLI pipeline.")
+    parser.add_argument("--backend", default="embedding")
+    parser.add_argument("--sample-size", type=int, default=200)
+    parser.add_argument("--training-folder", default="training_data")
+    parser.add_argument("--device", type=int, default=None, help="GPU index, -1 → CPU (default: GPU if available)")
+    args = parser.parse_args()
+
+    sample = sample_training_texts(args.training_folder, args.sample_size)
+    print(f"🔍 Comparing '{args.backend}' with the reference pipeline on {len(sample)} held-out texts...")
+    result = check_agreement(
+        load_classifier("pipeline", device=args.device),
+        load_classifier(args.backend, device=args.device),
+        sample,
+        candidate_labels,
+    )
+    print(f"✅ Top-1 agreement: {result['top1_agreement']:.1%} "
+          f"(mean |Δ confidence| {result['mean_abs_confidence_diff']:.3f}, {result['rows']} rows)")
+    print(result["candidate_stats"].report(prefix=f"📈 '{args.backend}':"))
@@ -0,0 +1,117 @@
+# labeling_manifest.py — crash-safe record of which labeled batches are complete
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+MANIFEST_NAME = "manifest.json"
+
+# Read once at import (os.umask can only be read by setting it, which isn't thread-safe later)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_atomic(path, write_fn):
+    """Write to a temp file next to path, fsync, then rename over path."""
+    # Unique temp name → concurrent writers of the same path (threads included) never share it
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}.tmp-")
+    try:
+        with open(fd, "w", newline="") as f:
+            write_fn(f)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp files are 0600 → keep the target's mode, or what open() would have given a new file
+        mode = os.stat(path).st_mode & 0o7777 if os.path.exists(path) else 0o666 & ~_UMASK
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_csv_atomic(df, path):
+    """Save a batch DataFrame atomically and return (row count, sha256 checksum)."""
+    write_atomic(path, lambda f: df.to_csv(f, index=False))
+    return len(df), file_checksum(path)
+
+
+class BatchManifest:
+    """manifest.json inside an output_chunks_* folder: batch file → rows + checksum.
+
+    A batch only counts as done when it is listed here and the file on disk still
+    matches the recorded checksum, so a CSV left half-written by a crash is redone.
+    Updates are locked: the sharded run records from its collector thread while the
+    producer adopts older batches.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.batches = {}
+        self._lock = threading.RLock()
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                self.batches = json.load(f).get("batches", {})
+
+    def is_complete(self, batch_filename):
+        entry = self.batches.get(os.path.basename(batch_filename))
+        if entry is None or not os.path.exists(batch_filename):
+            return False
+        return file_checksum(batch_filename) == entry["sha256"]
+
+    def record(self, batch_filename, rows, checksum, **extra):
+        with self._lock:
+            self.batches[os.path.basename(batch_filename)] = {"rows": rows, "sha256": checksum, **extra}
+            self.save()
+
+    def adopt(self, batch_filename, **extra):
+        """Record a batch written before manifests existed, if the file looks complete."""
+        import pandas as pd
+
+        if os.path.basename(batch_filename) in self.batches:
+            return False  # recorded before but no longer matches its checksum → redo
+
+        with open(batch_filename, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                return False  # truncated mid-row
+        try:
+            rows = len(pd.read_csv(batch_filename))
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError):
+            return False
+        self.record(batch_filename, rows, file_checksum(batch_filename), adopted=True, **extra)
+        return True
+
+    def resume_point(self):
+        """(row, byte offset) just past the last batch of the contiguous completed prefix.
+
+        Streaming can restart there instead of re-reading the input from the top;
+        (0, None) means start from the beginning.
+        """
+        row, offset = 0, None
+        with self._lock:
+            entries = sorted(
+                (entry["start"], name, entry) for name, entry in self.batches.items()
+                if "next_offset" in entry
+            )
+        for start, name, entry in entries:
+            if start != row or not self.is_complete(os.path.join(self.folder, name)):
+                break
+            row, offset = entry["next_row"], entry["next_offset"]
+        return row, offset
+
+    def save(self):
+        with self._lock:
+            write_atomic(self.path, lambda f: json.dump({"batches": self.batches}, f, indent=2, sort_keys=True))
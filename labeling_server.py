@@ -0,0 +1,207 @@
+# labeling_server.py — long-lived labeling service: model loaded once, concurrent requests micro-batched
+#
+#   python labeling_server.py --backend onnx
+#   curl -s localhost:8765/label -d '{"texts": ["best pizza near me"], "top_k": 3}'
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from iab_labels import candidate_labels, to_full_label
+from zero_shot_engine import HYPOTHESIS_TEMPLATE, ThroughputStats, label_texts
+
+# CONFIG
+HOST = "127.0.0.1"
+PORT = 8765
+SERVER_URL = os.getenv("LABELING_SERVER_URL", f"http://{HOST}:{PORT}")
+MAX_BATCH_ROWS = 256  # texts gathered into one label_texts call (it splits them into token-budgeted forward passes)
+MAX_WAIT_MS = 20  # how long the first request of a micro-batch waits for others to join
+MAX_BATCH_TOKENS = 8192
+MAX_FORWARD_ROWS = 64
+DEFAULT_TOP_K = 3
+
+
+class MicroBatcher:
+    """Collects texts from concurrent callers and labels them together on one worker thread.
+
+    A batch closes when it holds MAX_BATCH_ROWS texts or MAX_WAIT_MS after its first
+    request arrived, whichever comes first; a single large request is never split.
+    """
+
+    def __init__(self, classifier, open_cache=None, max_batch_rows=MAX_BATCH_ROWS, max_wait_ms=MAX_WAIT_MS):
+        self.classifier = classifier
+        self.open_cache = open_cache  # called on the worker thread (SQLite connections stay on their thread)
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = queue.Queue()
+        self.stats = ThroughputStats()
+        self.micro_batches = 0
+        self.requests_served = 0
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, texts):
+        """Blocking call from a request thread → one output dict (or None for empty text) per text."""
+        pending = {"texts": list(texts), "done": threading.Event(), "outputs": None, "error": None}
+        self.requests.put(pending)
+        pending["done"].wait()
+        if pending["error"] is not None:
+            raise pending["error"]
+        return pending["outputs"]
+
+    def next_batch(self):
+        batch = [self.requests.get()]
+        rows = len(batch[0]["texts"])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            rows += len(pending["texts"])
+        return batch
+
+    def run(self):
+        cache = self.open_cache() if self.open_cache else None
+        while True:
+            batch = self.next_batch()
+            texts = [text for pending in batch for text in pending["texts"]]
+            try:
+                outputs = label_texts(self.classifier, texts, candidate_labels, max_batch_tokens=MAX_BATCH_TOKENS,
+                                      max_batch_rows=MAX_FORWARD_ROWS, stats=self.stats, cache=cache)
+            except Exception as e:  # fail the waiting requests, keep serving
+                outputs, error = None, e
+            else:
+                error = None
+
+            start = 0
+            for pending in batch:
+                end = start + len(pending["texts"])
+                pending["outputs"] = outputs[start:end] if outputs is not None else None
+                pending["error"] = error
+                pending["done"].set()
+                start = end
+            self.micro_batches += 1
+            self.requests_served += len(batch)
+
+
+def format_output(text, output, top_k=DEFAULT_TOP_K):
+    if output is None:
+        return {"text": text, "iab_label": None, "confidence": None, "top": []}
+    top = [{"iab_label": to_full_label(label), "score": round(score, 4)}
+           for label, score in zip(output["labels"][:top_k], output["scores"][:top_k])]
+    return {"text": text, "iab_label": top[0]["iab_label"], "confidence": round(output["scores"][0], 2), "top": top}
+
+
+class LabelingHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default backlog of 5 resets bursts of concurrent clients
+
+
+def make_handler(batcher, backend):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self.send_json(404, {"error": "not found"})
+            self.send_json(200, {
+                "status": "ok",
+                "backend": backend,
+                "requests": batcher.requests_served,
+                "micro_batches": batcher.micro_batches,
+                "throughput": batcher.stats.report(prefix="").strip(),
+            })
+
+        def do_POST(self):
+            if self.path != "/label":
+                return self.send_json(404, {"error": "not found"})
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                texts = request["texts"]
+                if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                    raise ValueError("'texts' must be a list of strings")
+                top_k = request.get("top_k", DEFAULT_TOP_K)
+                if not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 1:
+                    raise ValueError("'top_k' must be a positive integer")
+            except (KeyError, ValueError) as e:
+                return self.send_json(400, {"error": f"bad request: {e}"})
+
+            try:
+                outputs = batcher.submit(texts)
+            except Exception as e:
+                return self.send_json(500, {"error": f"{e.__class__.__name__}: {e}"})
+            self.send_json(200, {"results": [format_output(t, o, top_k) for t, o in zip(texts, outputs)]})
+
+        def log_message(self, format, *args):
+            pass  # per-request lines would drown the startup / error output
+
+    return Handler
+
+
+def suggest_labels(texts, url=None, top_k=DEFAULT_TOP_K, timeout=600):
+    """Client: label texts with a running labeling_server → one result dict per text (same order)."""
+    payload = json.dumps({"texts": list(texts), "top_k": top_k}).encode("utf-8")
+    request = urllib.request.Request(f"{url or SERVER_URL}/label", data=payload,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())["results"]
+
+
+def server_is_up(url=None, timeout=1.0):
+    try:
+        with urllib.request.urlopen(f"{url or SERVER_URL}/health", timeout=timeout) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def main():
+    from label_cache import LabelCache
+    from labeling_backends import backend_model_name, load_classifier
+    from train import LABEL_CACHE_PATH
+
+    parser = argparse.ArgumentParser(description="Serve zero-shot IAB labels over HTTP with micro-batching.")
+    parser.add_argument("--backend", default="pipeline", help="pipeline | embedding | cascade | quantized | onnx")
+    parser.add_argument("--device", type=int, default=None, help="GPU index, -1 → CPU (default: GPU if available)")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--max-batch-rows", type=int, default=MAX_BATCH_ROWS)
+    parser.add_argument("--no-cache", action="store_true", help="don't use the train.py label cache")
+    args = parser.parse_args()
+
+    def open_cache():
+        # Same cache as train.py → texts labeled there (or earlier here) come back without a forward pass
+        return LabelCache(LABEL_CACHE_PATH, backend_model_name(args.backend), candidate_labels, HYPOTHESIS_TEMPLATE)
+
+    classifier = load_classifier(args.backend, device=args.device)
+    batcher = MicroBatcher(classifier, None if args.no_cache else open_cache,
+                           max_batch_rows=args.max_batch_rows, max_wait_ms=args.max_wait_ms)
+
+    server = LabelingHTTPServer((args.host, args.port), make_handler(batcher, args.backend))
+    print(f"✅ Loaded '{args.backend}' backend → serving on http://{args.host}:{args.port} (POST /label, GET /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(batcher.stats.report(prefix=f"📈 {batcher.requests_served} requests in {batcher.micro_batches} micro-batches:"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,175 @@
 import streamlit as st
 import pandas as pd
 import os
+from labeling_manifest import write_atomic
+from labeling_server import SERVER_URL, server_is_up, suggest_labels
 
 # CONFIG
 MISSING_DIR = "balanced_split_output/missing_classes"
 OUTPUT_DIR = "output_chunks/output_chunks_manual"
+SUGGESTION_COLUMNS = ["🔮 suggested_label", "🔮 suggested_confidence"]  # display only, not saved
+PAGE_SIZE = 200  # rows shown in the grid at a time
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# List available CSVs
-csv_files = [f for f in os.listdir(MISSING_DIR) if f.endswith(".csv")]
 
-st.title("📦 Manual Data Review Tool")
-selected_csv = st.selectbox("Select a missing class file to review:", csv_files)
+# Streamlit reruns the whole script on every click → parsed files are cached by (path, mtime)
+@st.cache_data
+def list_csv_files(folder, folder_mtime):
+    return sorted(f for f in os.listdir(folder) if f.endswith(".csv"))
 
-if selected_csv:
-    file_path = os.path.join(MISSING_DIR, selected_csv)
+
+@st.cache_data(max_entries=8)
+def load_missing_file(file_path, mtime):
     df = pd.read_csv(file_path)
 
     # Ensure required columns
     df["source"] = df.get("source", "zero_shot")
     df["confidence"] = df.get("confidence", 0.0)
+    return df
+
+
+@st.cache_data(max_entries=8)
+def saved_texts(output_path, mtime):
+    # Texts already appended to the output file (earlier sessions included)
+    return set(pd.read_csv(output_path, usecols=["text"])["text"].astype(str))
+
+
+def mtime(path):
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+
+def output_header(output_path):
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return None
+    return pd.read_csv(output_path, nrows=0).columns.tolist()
+
+
+def ensure_output_columns(output_path, columns):
+    """Migrate an output file once (when it is opened) so its header has every review column."""
+    header = output_header(output_path)
+    missing = [c for c in columns if header is not None and c not in header]
+    if missing:
+        existing = pd.read_csv(output_path).reindex(columns=header + missing)
+        write_atomic(output_path, lambda f: existing.to_csv(f, index=False))
+
+
+def append_rows(rows, output_path):
+    # Saves only append (saved_texts re-reads the file once per save, keyed by mtime); rows are lined up
+    # with the file's own header (older files: text,labels,confidence,source,iab_label)
+    header = output_header(output_path)
+    if header is None:
+        rows.to_csv(output_path, index=False)
+        return
+    rows.reindex(columns=header).to_csv(output_path, mode="a", header=False, index=False)
+
+
+def build_page(df, start, approved, already_saved, results):
+    page_df = df.iloc[start:start + PAGE_SIZE].copy()
+    file_rows = page_df.index
 
     # Add selection column
-    df["✅ Approve"] = False
+    page_df["✅ Approve"] = page_df.index.isin(list(approved))
+    for row_id, row in approved.items():
+        if row_id in file_rows:
+            page_df.loc[row_id, row.index] = row.values  # show earlier edits of approved rows
+
+    # Rows added on this page in the grid and approved → shown again below the file's rows
+    added = [(key[2], row) for key, row in approved.items() if added_on_page(key, start)]
+    if added:
+        added_df = pd.DataFrame([row for _, row in added], index=[row_id for row_id, _ in added])
+        added_df["✅ Approve"] = True
+        page_df = pd.concat([page_df, added_df])
+    page_df["💾 Saved"] = page_df["text"].astype(str).isin(already_saved)
 
-    st.write(f"### Review and select rows for: {selected_csv}")
+    if results is not None and len(results) == len(df):
+        page_results = results[start:start + PAGE_SIZE]
+        page_df[SUGGESTION_COLUMNS[0]] = pd.Series([r["iab_label"] for r in page_results], index=file_rows)
+        page_df[SUGGESTION_COLUMNS[1]] = pd.Series([r["confidence"] for r in page_results], index=file_rows)
+    return page_df
+
+
+def added_on_page(key, start):
+    # Approval keys: a file row id, or ("added", page start, grid row id) for rows added in the grid
+    return isinstance(key, tuple) and key[1] == start
+
+
+# List available CSVs
+csv_files = list_csv_files(MISSING_DIR, mtime(MISSING_DIR))
+
+st.title("📦 Manual Data Review Tool")
+selected_csv = st.selectbox("Select a missing class file to review:", csv_files)
+
+if selected_csv:
+    file_path = os.path.join(MISSING_DIR, selected_csv)
+    output_path = os.path.join(OUTPUT_DIR, selected_csv)
+    df = load_missing_file(file_path, mtime(file_path))
+    ensure_output_columns(output_path, list(df.columns))
+
+    # Approvals (with any cell edits) per file, kept across pages until saved
+    approved = st.session_state.setdefault("approved", {}).setdefault(selected_csv, {})
+    already_saved = saved_texts(output_path, mtime(output_path)) if os.path.exists(output_path) else set()
+
+    # Live suggestions from labeling_server.py → the whole file goes over in one batched request
+    suggestions = st.session_state.setdefault("suggestions", {})
+    if st.button("🔮 Suggest labels"):
+        if not server_is_up():
+            st.warning(f"⚠️ Labeling server not reachable at {SERVER_URL} → start it with `python labeling_server.py`.")
+        else:
+            try:
+                with st.spinner(f"Labeling {len(df)} rows..."):
+                    suggestions[selected_csv] = suggest_labels(df["text"].astype(str).tolist())
+            except OSError as e:  # URLError / HTTPError / timeouts → the server failed mid-request
+                st.error(f"❌ Labeling request to {SERVER_URL} failed: {e}")
+
+    num_pages = max(1, -(-len(df) // PAGE_SIZE))
+    page = st.number_input(f"Page (of {num_pages}, {PAGE_SIZE} rows each)", min_value=1, max_value=num_pages, value=1)
+    start = (page - 1) * PAGE_SIZE
+
+    # The grid's data stays fixed while a page is open (st.data_editor drops its edits when its data
+    # changes); it is rebuilt from the stored approvals when the page, file, suggestions or saves change
+    view = (selected_csv, page, selected_csv in suggestions, len(already_saved))
+    if st.session_state.get("view") != view:
+        st.session_state["view"] = view
+        st.session_state["view_id"] = st.session_state.get("view_id", 0) + 1
+        st.session_state["page_df"] = build_page(df, start, approved, already_saved, suggestions.get(selected_csv))
+    page_df = st.session_state["page_df"]
+
+    st.write(f"### Review and select rows for: {selected_csv} (rows {start + 1}–{min(start + PAGE_SIZE, len(df))} of {len(df)})")
     edited_df = st.data_editor(
-        df,
+        page_df,
         use_container_width=True,
         num_rows="dynamic",
-        key="editor"
+        disabled=["💾 Saved"] + SUGGESTION_COLUMNS,
+        key=f"editor_{st.session_state['view_id']}"
     )
 
+    # Remember this page's approvals: file rows keep their index from the file; rows added in the grid
+    # continue the page's index (which the next page also uses) → they get keys of their own
+    page_rows = range(start, min(start + PAGE_SIZE, len(df)))
+    seen = set()
+    for row_id, row in edited_df.iterrows():
+        key = row_id if row_id in page_rows else ("added", start, row_id)
+        seen.add(key)
+        if pd.notna(row["✅ Approve"]) and row["✅ Approve"]:
+            approved[key] = row.drop(["✅ Approve", "💾 Saved"] + SUGGESTION_COLUMNS, errors="ignore")
+        else:
+            approved.pop(key, None)
+    for key in [k for k in approved if k not in seen and (k in page_rows or added_on_page(k, start))]:
+        approved.pop(key)  # row deleted in the grid
+
     # Filter approved rows
-    approved_rows = edited_df[edited_df["✅ Approve"] == True].copy()
+    approved_rows = pd.DataFrame(list(approved.values()))
+    if not approved_rows.empty:
+        approved_rows = approved_rows[approved_rows["text"].notna() & ~approved_rows["text"].astype(str).isin(already_saved)]
+    st.caption(f"{len(approved)} row(s) approved in this file, {len(approved_rows)} not saved yet.")
 
     if st.button("💾 Save Selected Rows"):
         if not approved_rows.empty:
             approved_rows["source"] = "manual"
             approved_rows["confidence"] = 0.9
-            approved_rows.drop(columns=["✅ Approve"], inplace=True)
 
-            output_path = os.path.join(OUTPUT_DIR, selected_csv)
-            approved_rows.to_csv(output_path, index=False)
-            st.success(f"✅ Saved {len(approved_rows)} approved rows to {output_path}")
+            append_rows(approved_rows, output_path)
+            approved.clear()
+            st.success(f"✅ Appended {len(approved_rows)} approved rows to {output_path}")
         else:
-            st.warning("⚠️ No rows selected. Check the boxes in the '✅ Approve' column.")
+            st.warning("⚠️ No new rows selected. Check the boxes in the '✅ Approve' column.")
@@ -1,30 +1,50 @@
 import pandas as pd
 import glob
+import json
 import os
 
-# Find all folders starting with "output_chunks_"
-output_folders = glob.glob("output_chunks/output_chunks_*")
+import numpy as np
 
-# Collect all batch CSV files from all matching folders
-batch_files = []
-for folder in output_folders:
-    files = glob.glob(os.path.join(folder, "labeled_batch_*.csv"))
-    for file in files:
-        batch_files.append((file, folder))  # store both file and folder info
+import dataset_io
+import near_duplicates
+from dataset_io import dataset_path, read_dataset, write_dataset
+from instrumentation import run_main, span
+from labeling_manifest import write_atomic
 
-    files = glob.glob(os.path.join(folder, "missing_*.csv"))
-    for file in files:
-        batch_files.append((file, folder))  # store both file and folder info
-        
+# CONFIG
+OUTPUT_STEM = "labeled_zero_shot_output_combined"  # + .parquet / .csv, see dataset_io.STORAGE_FORMAT
+STATE_DIR = ".merge_state"  # which chunk files are folded in + dedup index
+STATE_FILE = os.path.join(STATE_DIR, "manifest.json")
+INDEX_STEM = os.path.join(STATE_DIR, "index")  # one row per (text hash, chunk file) occurrence + which one is kept
+FULL_REBUILD = False  # True → ignore the state and re-read every chunk
+NEAR_DEDUP = True  # collapse near-duplicate texts (near_duplicates.py); the exact-dedup base stays in STATE_DIR
+BASE_STEM = os.path.join(STATE_DIR, "base")  # exact-dedup combined rows (= OUTPUT_STEM when NEAR_DEDUP is off)
+SIGNATURE_FILE = os.path.join(STATE_DIR, "minhash.npz")  # MinHash signatures by text hash, reused across merges
+NEAR_DUP_STATS_FILE = "near_duplicate_stats.json"
+NEAR_DUP_CLUSTERS_STEM = "near_duplicate_clusters"  # every row of every multi-row cluster, for review
 
-# Optional: print how many files found
-print(f"Found {len(batch_files)} batch files in {len(output_folders)} folders.")
 
-# Load and concatenate all batches
-df_list = []
-for file, folder in batch_files:
+def find_chunk_files():
+    # Find all folders starting with "output_chunks_"
+    output_folders = glob.glob("output_chunks/output_chunks_*")
+
+    # Collect all batch CSV files from all matching folders
+    batch_files = []
+    for folder in output_folders:
+        files = glob.glob(os.path.join(folder, "labeled_batch_*.csv"))
+        for file in files:
+            batch_files.append((file, folder))  # store both file and folder info
+
+        files = glob.glob(os.path.join(folder, "missing_*.csv"))
+        for file in files:
+            batch_files.append((file, folder))  # store both file and folder info
+
+    return batch_files, output_folders
+
+
+def read_chunk(file, folder):
     df = pd.read_csv(file)
-    
+
     # Determine source based on folder name
     if folder.startswith("output_chunks/output_chunks_synthetic"):
         df["source"] = "synthetic"
@@ -34,16 +54,239 @@ for file, folder in batch_files:
         df["source"] = "manual"
     else:
         df["source"] = "unknown"  # fallback (safe guard)
-    
-    df_list.append(df)
 
-combined_df = pd.concat(df_list, ignore_index=True)
+    return df
+
+
+def hash_texts(texts):
+    # 64-bit hash per text → dedup index key (exact text, like drop_duplicates on "text")
+    return pd.util.hash_pandas_object(texts, index=False).to_numpy()
+
+
+def file_signature(file):
+    stat = os.stat(file)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def base_stem():
+    return BASE_STEM if NEAR_DEDUP else OUTPUT_STEM
+
+
+def near_dedup_params():
+    return near_duplicates.params() if NEAR_DEDUP else None
+
+
+def load_state():
+    base, output = dataset_path(base_stem()), dataset_path(OUTPUT_STEM)
+    if FULL_REBUILD or not all(os.path.exists(p) for p in (STATE_FILE, dataset_path(INDEX_STEM), base, output)):
+        return None
+    with open(STATE_FILE, "r") as f:
+        state = json.load(f)
+    return state if state.get("output") == output and state.get("base") == base else None
+
+
+def save_state(files):
+    state = {"output": dataset_path(OUTPUT_STEM), "base": dataset_path(base_stem()), "files": files,
+             "near_dedup": near_dedup_params()}
+    write_atomic(STATE_FILE, lambda f: json.dump(state, f, indent=2, sort_keys=True))
+
+
+def read_index():
+    index_df = read_dataset(INDEX_STEM)
+    index_df["text_hash"] = index_df["text_hash"].astype("uint64")
+    return index_df
+
+
+def write_index(index_df):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    index_df = index_df.astype({"chunk": "category"}) if dataset_io.STORAGE_FORMAT == "parquet" else index_df
+    with span("merge.write_index", rows=len(index_df)):
+        write_dataset(index_df, INDEX_STEM, export_csv=False)
+
+
+def fold_chunks(chunks, seen):
+    """Read chunks in order → (new unique rows, index occurrences). seen: set of hashes already combined."""
+    rows, occurrences = [], []
+    with span("merge.read_chunks", files=len(chunks)) as step:
+        for file, folder in chunks:
+            df = read_chunk(file, folder)
+            hashes = hash_texts(df["text"])
+
+            # Keep only texts that are new to the combined dataset (first occurrence wins)
+            fresh = ~pd.Series(hashes).isin(seen).to_numpy() & ~pd.Series(hashes).duplicated().to_numpy()
+            occurrences.append(pd.DataFrame({"text_hash": hashes, "chunk": file, "owner": fresh}))
+            rows.append(df[fresh])
+            seen.update(hashes[fresh])
+        step.rows = sum(len(o) for o in occurrences)
+    return rows, occurrences
+
+
+def cached_signatures(texts):
+    """MinHash signatures for texts, computing only the ones not in SIGNATURE_FILE from an earlier merge."""
+    hashes = hash_texts(texts)
+    signatures = np.empty((len(texts), near_duplicates.NUM_PERM), dtype=np.uint32)
+    found = np.zeros(len(texts), dtype=bool)
+    if os.path.exists(SIGNATURE_FILE):
+        cache = np.load(SIGNATURE_FILE)
+        if json.loads(str(cache["params"])) == near_duplicates.params():
+            position = pd.Index(cache["hashes"]).get_indexer(hashes)
+            found = position >= 0
+            signatures[found] = cache["signatures"][position[found]]
+
+    missing = np.flatnonzero(~found)
+    print(f"🧬 MinHash: {len(texts) - len(missing)} cached, {len(missing)} computed")
+    if len(missing):
+        with span("merge.minhash", rows=len(missing)):
+            signatures[missing] = near_duplicates.minhash_signatures(texts.iloc[missing])
+        os.makedirs(STATE_DIR, exist_ok=True)
+        tmp_path = f"{SIGNATURE_FILE}.tmp-{os.getpid()}.npz"
+        np.savez(tmp_path, hashes=hashes, signatures=signatures, params=json.dumps(near_duplicates.params()))
+        os.replace(tmp_path, SIGNATURE_FILE)
+    return signatures
+
+
+def write_output(combined_df):
+    """Write the exact-dedup base; with NEAR_DEDUP also collapse near-duplicates into OUTPUT_STEM."""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with span("merge.write_base", rows=len(combined_df)):
+        write_dataset(combined_df, base_stem(), export_csv=False if NEAR_DEDUP else None)
+    if not NEAR_DEDUP:
+        return len(combined_df)
+
+    combined_df = combined_df.reset_index(drop=True)
+    with span("merge.near_dedup", rows=len(combined_df)) as step:
+        deduped_df, clusters, keep, stats = near_duplicates.collapse(combined_df, cached_signatures(combined_df["text"]))
+        step.set(removed=len(combined_df) - len(deduped_df))
+    with span("merge.write_output", rows=len(deduped_df)):
+        write_dataset(deduped_df, OUTPUT_STEM)
+
+    # Review file: members of every multi-row cluster, kept row first
+    in_cluster = np.bincount(clusters)[clusters] > 1
+    review_df = combined_df[in_cluster].assign(cluster=clusters[in_cluster], kept=keep[in_cluster])
+    review_df = review_df.sort_values(["cluster", "kept"], ascending=[True, False], kind="stable")
+    dataset_io.to_csv_frame(review_df).to_csv(dataset_path(NEAR_DUP_CLUSTERS_STEM, "csv"), index=False)
+    write_atomic(NEAR_DUP_STATS_FILE, lambda f: json.dump(stats, f, indent=2))
+    near_duplicates.print_stats(stats)
+    return len(deduped_df)
+
+
+def full_rebuild(batch_files):
+    rows, occurrences = fold_chunks(batch_files, set())
+    combined_df = pd.concat(rows, ignore_index=True)
+    index_df = pd.concat(occurrences, ignore_index=True)
+
+    num_rows = write_output(combined_df)
+    write_index(index_df)
+    save_state({file: file_signature(file) for file, _ in batch_files})
+    return combined_df, num_rows
+
+
+def incremental_merge(batch_files, state):
+    """Fold only new / changed chunk files into the combined dataset.
+
+    Rows owned by a changed or removed chunk are dropped; if the same text also
+    appears in an unchanged chunk, that chunk is re-read so its copy takes over.
+    Returns (output row count, files read) or None when everything is up to date.
+    """
+    folder_of = dict(batch_files)
+    current = {file: file_signature(file) for file, _ in batch_files}
+    known = state["files"]
+
+    new = [f for f, _ in batch_files if f not in known]
+    changed = [f for f, _ in batch_files if f in known and known[f] != current[f]]
+    removed = [f for f in known if f not in current]
+    print(f"→ {len(new)} new, {len(changed)} changed, {len(removed)} removed chunk files "
+          f"({len(batch_files) - len(new) - len(changed)} already folded in)")
+    if not (new or changed or removed):
+        if state.get("near_dedup") != near_dedup_params():
+            print("🧬 Near-duplicate settings changed → re-clustering the combined rows")
+            num_rows = write_output(read_dataset(base_stem()))
+            save_state(current)
+            return num_rows, 0
+        return None
+
+    index_df = read_index()
+    stale = set(changed) | set(removed)
+
+    if not stale and dataset_io.STORAGE_FORMAT == "csv" and not NEAR_DEDUP:
+        # Fast path: append the new chunks' unseen rows to the combined CSV
+        output_file = dataset_path(OUTPUT_STEM)
+        header = pd.read_csv(output_file, nrows=0).columns.tolist()
+        seen = set(index_df["text_hash"])
+        rows, occurrences = fold_chunks([(f, folder_of[f]) for f in new], seen)
+        new_rows = pd.concat(rows, ignore_index=True)
+        extra_columns = [c for c in new_rows.columns if c not in header and new_rows[c].notna().any()]
+        if not extra_columns:
+            new_rows.reindex(columns=header).to_csv(output_file, mode="a", header=False, index=False)
+            pd.concat(occurrences, ignore_index=True).to_csv(dataset_path(INDEX_STEM), mode="a", header=False, index=False)
+            save_state(current)
+            return len(seen), len(new)
+        print(f"⚠️ New columns {extra_columns} → rewriting combined CSV")
+
+    # Parquet can't be appended to → load the combined dataset (cheap, columnar) and rewrite it
+    with span("merge.read_base") as step:
+        combined_df = read_dataset(base_stem())
+        step.rows = len(combined_df)
+    combined_hashes = hash_texts(combined_df["text"])
+
+    # Drop everything the stale chunks contributed
+    owners = index_df[index_df["owner"]]
+    orphaned = set(owners.loc[owners["chunk"].isin(stale), "text_hash"])
+    index_df = index_df[~index_df["chunk"].isin(stale)]
+    keep = ~pd.Series(combined_hashes).isin(orphaned).to_numpy()
+    combined_df = combined_df[keep]
+    seen = set(combined_hashes[keep])
+
+    # Changed chunks owned these texts before, so they get first claim on them again
+    changed_rows, changed_occurrences = fold_chunks([(f, folder_of[f]) for f in changed], seen)
+
+    # Texts still present in unchanged chunks get their next occurrence back
+    refill = index_df[index_df["text_hash"].isin(orphaned - seen)].drop_duplicates("text_hash")
+    refill_rows = []
+    for file in refill["chunk"].unique():
+        df = read_chunk(file, folder_of[file])
+        hashes = hash_texts(df["text"])
+        wanted = set(refill.loc[refill["chunk"] == file, "text_hash"])
+        pick = pd.Series(hashes).isin(wanted).to_numpy() & ~pd.Series(hashes).duplicated().to_numpy()
+        refill_rows.append(df[pick])
+        seen.update(hashes[pick])
+    index_df.loc[refill.index, "owner"] = True
+
+    rows, occurrences = fold_chunks([(f, folder_of[f]) for f in new], seen)
+    rows, occurrences = changed_rows + refill_rows + rows, changed_occurrences + occurrences
+    files_read = len(new) + len(changed) + refill["chunk"].nunique()
+
+    combined_df = pd.concat([combined_df, *rows], ignore_index=True)
+    index_df = pd.concat([index_df, *occurrences], ignore_index=True)
+    num_rows = write_output(combined_df)
+    write_index(index_df)
+    save_state(current)
+    return num_rows, files_read
+
+
+def main():
+    batch_files, output_folders = find_chunk_files()
+
+    # Optional: print how many files found
+    print(f"Found {len(batch_files)} batch files in {len(output_folders)} folders.")
+
+    state = load_state()
+    if state is not None:
+        print("🔁 Incremental merge (state in .merge_state/)")
+        result = incremental_merge(batch_files, state)
+        if result is None:
+            print(f"\n✅ {dataset_path(OUTPUT_STEM)} is up to date — no chunk files changed.")
+        else:
+            num_rows, files_read = result
+            print(f"\n✅ Read {files_read} chunk files; {dataset_path(OUTPUT_STEM)} now has {num_rows} unique rows.")
+        return
 
-# Remove duplicate rows → based on "text" only
-combined_df = combined_df.drop_duplicates(subset=["text"]).reset_index(drop=True)
+    combined_df, num_rows = full_rebuild(batch_files)
+    print(f"\n✅ Combined {len(batch_files)} batch files from {len(output_folders)} folders.")
+    print(f"✅ Combined dataset saved as {dataset_path(OUTPUT_STEM)} with {num_rows} unique rows.")
+    if NEAR_DEDUP:
+        print(f"→ {len(combined_df)} exact-unique rows before near-duplicate removal.")
 
-# Save combined CSV
-combined_df.to_csv("labeled_zero_shot_output_combined.csv", index=False)
 
-print(f"\n✅ Combined {len(batch_files)} batch files from {len(output_folders)} folders.")
-print(f"✅ Combined CSV saved as labeled_zero_shot_output_combined.csv with {len(combined_df)} unique rows.")
+if __name__ == "__main__":
+    run_main(main, "merge")
@@ -0,0 +1,169 @@
+# near_duplicates.py — MinHash/LSH near-duplicate clustering for the merged training text
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# CONFIG
+NUM_PERM = 64  # MinHash values per text
+BANDS = 16  # LSH bands of NUM_PERM // BANDS values; texts sharing one band are candidates (S-curve ≈ 0.5)
+SHINGLE_BYTES = 4  # character shingles: every 4-byte window of the normalized UTF-8 text
+THRESHOLD = 0.8  # estimated Jaccard similarity at which two texts count as near-duplicates
+SEED = 13
+CHUNK_ROWS = 200_000  # signature rows computed at a time (bounds memory on multi-million row merges)
+
+
+def params():
+    # Everything that changes the signatures or the clusters (stored with cached signatures / merge state)
+    return {"num_perm": NUM_PERM, "bands": BANDS, "shingle_bytes": SHINGLE_BYTES, "threshold": THRESHOLD, "seed": SEED}
+
+
+def normalize(texts):
+    # Case, Unicode form, punctuation and whitespace differences don't make a new query
+    texts = pd.Series(texts, dtype="string").fillna("")
+    texts = texts.str.normalize("NFKC").str.casefold()
+    texts = texts.str.replace(r"[^\w\s]+", " ", regex=True).str.replace(r"\s+", " ", regex=True).str.strip()
+    return texts.str.pad(SHINGLE_BYTES, side="right", fillchar="\0")  # very short texts still get one shingle
+
+
+def shingle_values(texts):
+    """All SHINGLE_BYTES-byte windows of each text packed into uint64 → (values, start of each text's run)."""
+    encoded = normalize(texts).str.encode("utf-8")
+    lengths = encoded.str.len().to_numpy(dtype=np.int64)
+    buf = np.frombuffer(b"".join(encoded.tolist()), dtype=np.uint8).astype(np.uint64)
+
+    windows = np.zeros(len(buf) - SHINGLE_BYTES + 1, dtype=np.uint64)
+    for i in range(SHINGLE_BYTES):
+        windows = (windows << np.uint64(8)) | buf[i:len(buf) - SHINGLE_BYTES + 1 + i]
+
+    counts = lengths - SHINGLE_BYTES + 1
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+    positions = np.repeat(offsets - starts, counts) + np.arange(counts.sum())
+    return windows[positions], starts
+
+
+def hash_coefficients():
+    # Multiply-shift hashing: h(x) = (a*x + b mod 2**64) >> 32 with odd a → one "permutation" per (a, b)
+    rng = np.random.default_rng(SEED)
+    a = rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+    return a, b
+
+
+def minhash_signatures(texts):
+    """(len(texts), NUM_PERM) uint32 MinHash signatures."""
+    texts = pd.Series(texts, dtype="string").reset_index(drop=True)
+    a, b = hash_coefficients()
+    signatures = np.empty((len(texts), NUM_PERM), dtype=np.uint32)
+    with np.errstate(over="ignore"):
+        for chunk_start in range(0, len(texts), CHUNK_ROWS):
+            values, starts = shingle_values(texts.iloc[chunk_start:chunk_start + CHUNK_ROWS])
+            for j in range(NUM_PERM):
+                hashed = (values * a[j] + b[j]) >> np.uint64(32)
+                signatures[chunk_start:chunk_start + len(starts), j] = np.minimum.reduceat(hashed, starts)
+    return signatures
+
+
+def candidate_edges(signatures):
+    """Rows sharing an LSH band, as (leader, member) pairs that pass the similarity check."""
+    rows = NUM_PERM // BANDS
+    rng = np.random.default_rng(SEED + 1)
+    multipliers = rng.integers(1, 2 ** 63, size=rows, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+    leaders, members = [], []
+    with np.errstate(over="ignore"):
+        for band in range(BANDS):
+            band_values = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+            keys = (band_values * multipliers).sum(axis=1)
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            run_start = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            run_leader = np.repeat(order[run_start], np.diff(np.r_[run_start, len(order)]))
+            pair = run_leader != order  # star: every bucket member against the bucket's first row
+            leaders.append(run_leader[pair])
+            members.append(order[pair])
+
+    # The same pair usually shows up in several bands → verify it once
+    edges = np.unique(np.concatenate(leaders).astype(np.int64) * len(signatures) + np.concatenate(members))
+    leaders, members = np.divmod(edges, len(signatures))
+
+    # LSH only proposes pairs → keep the ones whose estimated Jaccard similarity is high enough
+    keep = np.zeros(len(leaders), dtype=bool)
+    for start in range(0, len(leaders), CHUNK_ROWS):
+        part = slice(start, start + CHUNK_ROWS)
+        similarity = (signatures[leaders[part]] == signatures[members[part]]).mean(axis=1)
+        keep[part] = similarity >= THRESHOLD
+    return leaders[keep], members[keep]
+
+
+def cluster_ids(signatures):
+    """Connected components over near-duplicate pairs → one cluster id per row."""
+    n = len(signatures)
+    leaders, members = candidate_edges(signatures)
+    graph = coo_matrix((np.ones(len(leaders), dtype=np.int8), (leaders, members)), shape=(n, n))
+    return connected_components(graph, directed=False)[1]
+
+
+def select_representatives(df, clusters, text_hashes):
+    """Per cluster keep a manual-source row first, then the highest confidence → bool mask.
+
+    Remaining ties go to the smallest text hash, so the pick doesn't depend on row order
+    (an incremental merge and a full rebuild keep the same row).
+    """
+    n = len(df)
+    manual = (df["source"] == "manual").to_numpy() if "source" in df.columns else np.zeros(n, dtype=bool)
+    # float32 like the stored dataset, so freshly read CSV rows compare equal to rows loaded from Parquet
+    confidence = df["confidence"].fillna(-1).to_numpy(np.float32) if "confidence" in df.columns else np.zeros(n)
+    order = np.lexsort((text_hashes, -confidence, ~manual, clusters))
+    sorted_clusters = clusters[order]
+    first = order[np.r_[True, sorted_clusters[1:] != sorted_clusters[:-1]]]
+    keep = np.zeros(n, dtype=bool)
+    keep[first] = True
+    return keep
+
+
+def cluster_stats(df, clusters, keep):
+    sizes = np.bincount(clusters)
+    multi = sizes[sizes > 1]
+    stats = {
+        "rows_in": int(len(df)),
+        "rows_out": int(keep.sum()),
+        "rows_removed": int(len(df) - keep.sum()),
+        "clusters": int(len(multi)),
+        "rows_in_clusters": int(multi.sum()),
+        "largest_cluster": int(multi.max()) if len(multi) else 0,
+        "size_histogram": {
+            "2": int((multi == 2).sum()),
+            "3-5": int(((multi >= 3) & (multi <= 5)).sum()),
+            "6-10": int(((multi >= 6) & (multi <= 10)).sum()),
+            ">10": int((multi > 10).sum()),
+        },
+    }
+    if "iab_label" in df.columns and len(multi):
+        in_cluster = sizes[clusters] > 1
+        labels_per_cluster = pd.Series(df["iab_label"].to_numpy()[in_cluster]).groupby(clusters[in_cluster]).nunique()
+        stats["clusters_with_mixed_labels"] = int((labels_per_cluster > 1).sum())
+    return stats
+
+
+def collapse(df, signatures=None):
+    """Collapse near-duplicate clusters of df["text"] → (kept rows, cluster id per input row, keep mask, stats)."""
+    if signatures is None:
+        signatures = minhash_signatures(df["text"])
+    # Cluster in text-hash order: LSH buckets are checked against their first row, so a fixed
+    # row order keeps the clusters identical however the rows arrived
+    text_hashes = pd.util.hash_pandas_object(df["text"], index=False).to_numpy()
+    canonical = np.argsort(text_hashes, kind="stable")
+    clusters = np.empty(len(df), dtype=np.int64)
+    clusters[canonical] = cluster_ids(signatures[canonical])
+    keep = select_representatives(df, clusters, text_hashes)
+    return df[keep], clusters, keep, cluster_stats(df, clusters, keep)
+
+
+def print_stats(stats):
+    print(f"🧬 Near-duplicates: {stats['clusters']} clusters covering {stats['rows_in_clusters']} rows "
+          f"→ removed {stats['rows_removed']} of {stats['rows_in']} rows (largest cluster {stats['largest_cluster']})")
+    print(f"   cluster sizes: {stats['size_histogram']}")
+    if "clusters_with_mixed_labels" in stats:
+        print(f"   clusters whose members carry different labels: {stats['clusters_with_mixed_labels']}")
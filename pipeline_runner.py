@@ -0,0 +1,153 @@
+# pipeline_runner.py — in-process stage DAG: content-hashed inputs, skip up-to-date stages, run independent ones concurrently
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from instrumentation import span
+from labeling_manifest import file_checksum, write_atomic
+
+STATE_DIR = ".pipeline_state"
+STAMP_FILE = os.path.join(STATE_DIR, "stamps.json")  # per stage: inputs hash + output hashes of the last good run
+
+
+class Stage:
+    """One pipeline step. inputs / outputs are file paths or glob patterns.
+
+    A stage runs after every stage that outputs one of its inputs. `params` (config
+    values the step depends on) are hashed together with the input files.
+    """
+
+    def __init__(self, name, fn, inputs=(), outputs=(), params=None):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+
+
+def is_pattern(path):
+    return glob.has_magic(path)
+
+
+def expand(paths):
+    files = set()
+    for path in paths:
+        files.update(glob.glob(path) if is_pattern(path) else [path])
+    return sorted(files)
+
+
+class FileHasher:
+    """sha256 of file contents, memoized by (mtime, size) so unchanged files are not re-read."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def digest(self, path):
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        cached = self.cache.get(path)
+        if cached and cached["mtime_ns"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+            return cached["sha256"]
+        checksum = file_checksum(path)
+        self.cache[path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": checksum}
+        return checksum
+
+
+def stage_dependencies(stages):
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            producers[output] = stage.name
+    deps = {}
+    for stage in stages:
+        deps[stage.name] = {producers[i] for i in stage.inputs if i in producers and producers[i] != stage.name}
+    return deps
+
+
+class PipelineRunner:
+    def __init__(self, stages, max_workers=4, force=False):
+        self.stages = {stage.name: stage for stage in stages}
+        self.deps = stage_dependencies(stages)
+        self.max_workers = max_workers
+        self.force = force
+        self.lock = threading.Lock()
+        self.state = self.load_state()
+        self.hasher = FileHasher(self.state["files"])
+        self.timings = {}
+
+    def load_state(self):
+        if os.path.exists(STAMP_FILE):
+            with open(STAMP_FILE, "r") as f:
+                return json.load(f)
+        return {"stages": {}, "files": {}}
+
+    def save_state(self):
+        os.makedirs(STATE_DIR, exist_ok=True)
+        with self.lock:
+            write_atomic(STAMP_FILE, lambda f: json.dump(self.state, f, indent=2, sort_keys=True))
+
+    def inputs_hash(self, stage):
+        files = [(path, self.hasher.digest(path)) for path in expand(stage.inputs)]
+        payload = json.dumps([files, stage.params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def is_up_to_date(self, stage, inputs_hash):
+        stamp = self.state["stages"].get(stage.name)
+        if self.force or stamp is None or stamp["inputs"] != inputs_hash:
+            return False
+        if any(not os.path.exists(path) for path in stage.outputs if not is_pattern(path)):
+            return False
+        return all(self.hasher.digest(path) == digest for path, digest in stamp["outputs"].items())
+
+    def run_stage(self, name):
+        with span(f"stage.{name}") as step:
+            self._run_stage(name, step)
+
+    def _run_stage(self, name, step):
+        stage = self.stages[name]
+        start = time.perf_counter()
+        inputs_hash = self.inputs_hash(stage)
+        if self.is_up_to_date(stage, inputs_hash):
+            self.timings[name] = ("skipped", time.perf_counter() - start)
+            step.set(skipped=True)
+            print(f"⏩ [{name}] up to date → skipped")
+            return
+
+        print(f"\n▶️ [{name}] running")
+        stage.fn()
+        outputs = {path: self.hasher.digest(path) for path in expand(stage.outputs)}
+        with self.lock:
+            self.state["stages"][name] = {"inputs": inputs_hash, "outputs": outputs}
+        self.save_state()
+        self.timings[name] = ("ran", time.perf_counter() - start)
+        print(f"⏱️ [{name}] done in {self.timings[name][1]:.2f}s")
+
+    def run(self):
+        """Run every stage once its upstream stages finished; independent stages run in parallel threads."""
+        pending = dict(self.deps)
+        done, running = set(), {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name in [n for n, deps in pending.items() if deps <= done]:
+                    running[pool.submit(self.run_stage, name)] = name
+                    del pending[name]
+                if not running:
+                    raise RuntimeError(f"Stages with unresolvable dependencies: {sorted(pending)}")
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    future.result()  # re-raise a stage failure; running stages finish when the pool closes
+                    done.add(name)
+        return self.timings
+
+    def report(self):
+        print("\n=== Stage timings ===")
+        for name in self.stages:
+            status, seconds = self.timings.get(name, ("not run", 0.0))
+            print(f"{name:<16} {status:<8} {seconds:8.2f}s")
@@ -1,118 +1,148 @@
 # run_full_pipeline.py (FINAL VERSION — with classes/ and word_frequencies/ folders)
+# Runs every step in-process as a stage DAG (pipeline_runner.py): stages whose inputs are unchanged are skipped
 
-import subprocess
-import pandas as pd
-import matplotlib.pyplot as plt
+import json
 import os
-import re
-from collections import Counter
-
-# Paths to your component scripts
-merge_script = "merge_batches_from_chunks.py"         # your combine script → this must save labeled_zero_shot_output_combined.csv
-balance_split_script = "balance_and_split.py"  # your balance/split script → this must save train/val/test + metadata_balanced.csv
-
-# Step 1 — run combine_batches.py
-print("\n=== STEP 1: Merging batches ===")
-subprocess.run(["python3", merge_script], check=True)
-
-# Step 2 — run balance_and_split.py
-print("\n=== STEP 2: Balancing, splitting, generating metadata ===")
-subprocess.run(["python3", balance_split_script], check=True)
-
-# Step 3 — run visualization on metadata_balanced.csv
-print("\n=== STEP 3: Visualizing balanced dataset ===")
-
-meta_file = "balanced_split_output/metadata_balanced.csv"
-
-if not os.path.exists(meta_file):
-    raise FileNotFoundError(f"ERROR: {meta_file} not found! Run balance_and_split.py first.")
-
-meta = pd.read_csv(meta_file)
-
-# Class distribution
-plt.figure(figsize=(12, 6))
-meta.sort_values("num_samples", ascending=False).plot.bar(x="iab_label", y="num_samples", legend=False)
-plt.title("Class Distribution (Balanced Data)")
-plt.ylabel("# Samples")
-plt.xticks(rotation=45, ha="right")
-plt.tight_layout()
-plt.savefig("balanced_split_output/class_distribution.png")
-plt.close()
-
-# Avg confidence per class
-plt.figure(figsize=(12, 6))
-meta.sort_values("avg_confidence", ascending=False).plot.bar(x="iab_label", y="avg_confidence", legend=False, color="orange")
-plt.title("Average Confidence per Class")
-plt.ylabel("Avg Confidence")
-plt.xticks(rotation=45, ha="right")
-plt.tight_layout()
-plt.savefig("balanced_split_output/avg_confidence.png")
-plt.close()
-
-# % synthetic vs natural
-if {"pct_synthetic", "pct_natural", "pct_manual"}.issubset(meta.columns):
-    meta_plot = meta[["iab_label", "pct_synthetic", "pct_natural", "pct_manual"]].set_index("iab_label")
-    meta_plot.plot.bar(
-        stacked=True,
-        figsize=(12,6),
-        color=["#ff9999", "#99ccff", "#a0e57c"]
-    )
-    plt.title("Source Composition (% Synthetic, Natural, Manual)")
-    plt.ylabel("%")
-    plt.xticks(rotation=45, ha="right")
-    plt.tight_layout()
-    plt.savefig("balanced_split_output/source_composition.png")
-    plt.close()
-else:
-    print("\n⚠️ No 'source' column found → skipping source composition plot.")
-
-# Step 4 — Save one CSV per class → balanced_split_output/classes/
-print("\n=== STEP 4: Saving per-class CSVs ===")
-
-train_file = "balanced_split_output/train.csv"
-train_df = pd.read_csv(train_file)
-
-# Make folder balanced_split_output/classes/ if not exist
-classes_folder = "balanced_split_output/classes"
-os.makedirs(classes_folder, exist_ok=True)
-
-# Step 5 — Visualizing word variation per class → balanced_split_output/word_frequencies/
-print("\n=== STEP 5: Visualizing word variation per class ===")
-
-# Make folder balanced_split_output/word_frequencies/ if not exist
-word_freq_folder = "balanced_split_output/word_frequencies"
-os.makedirs(word_freq_folder, exist_ok=True)
-
-# Simple tokenizer → split on non-word characters
-def tokenize(text):
-    return re.findall(r'\b\w+\b', str(text).lower())
-
-# Process each class
-for label in train_df["iab_label"].unique():
-    class_df = train_df[train_df["iab_label"] == label]
-    
-    all_words = []
-    for text in class_df["text"]:
-        all_words.extend(tokenize(text))
-    
-    word_counts = Counter(all_words)
-    most_common = word_counts.most_common(20)  # top 20 words
-    
-    words, counts = zip(*most_common) if most_common else ([], [])
-    
-    plt.figure(figsize=(10, 6))
-    plt.bar(words, counts, color="skyblue")
-    plt.title(f"Top 20 Words in Class: {label}")
-    plt.ylabel("Frequency")
-    plt.xticks(rotation=45, ha="right")
-    plt.tight_layout()
-    
-    label_safe = label.replace(" ", "_").replace("’", "").replace(",", "").replace("–", "-")
-    word_freq_filename = os.path.join(word_freq_folder, f"word_freq_{label_safe}.png")
-    
-    plt.savefig(word_freq_filename)
-    plt.close()
-    
-    print(f"✅ Saved {word_freq_filename}")
-
-print("\n🎉 FULL PIPELINE COMPLETE! Outputs in balanced_split_output/ 🚀")
+import pandas as pd
+import balance_and_split as bs
+import merge_batches_from_chunks as merge
+import near_duplicates
+import tokenized_cache
+from charts import chart, chart_pool, render_charts, word_frequencies
+from dataset_io import dataset_files, read_dataset, STORAGE_FORMAT
+from instrumentation import run_main, span
+from pipeline_runner import PipelineRunner, Stage
+
+CHART_WORKERS = os.cpu_count()  # PNGs are rendered in a process pool
+STAGE_WORKERS = 4  # independent stages (class exports, splits, charts) run in parallel threads
+TOP_N_WORDS = 20
+FORCE = False  # True → re-run every stage even if up to date
+TOKENIZE_SPLITS = False  # opt-in (needs transformers + the tokenizer) → memory-mapped train/val/test token arrays for fine-tuning (tokenized_cache.py)
+
+META_FILE = os.path.join(bs.OUTPUT_FOLDER, "metadata_balanced.csv")
+METADATA_FILES = [os.path.join(bs.OUTPUT_FOLDER, f"metadata_{name}.csv") for name in ["train", "val", "test", "balanced"]]
+SPLIT_STEMS = [os.path.join(bs.OUTPUT_FOLDER, name) for name in ["train", "val", "test"]]
+WORD_FREQ_FOLDER = os.path.join(bs.OUTPUT_FOLDER, "word_frequencies")
+CHUNK_FILES = ["output_chunks/output_chunks_*/labeled_batch_*.csv", "output_chunks/output_chunks_*/missing_*.csv"]
+
+
+def metadata_charts(meta):
+    # Class distribution, avg confidence per class, % synthetic vs natural vs manual
+    by_samples = meta.sort_values("num_samples", ascending=False)
+    by_confidence = meta.sort_values("avg_confidence", ascending=False)
+    specs = [
+        chart("bar", "balanced_split_output/class_distribution.png",
+              labels=by_samples["iab_label"].tolist(), values=by_samples["num_samples"].tolist(),
+              title="Class Distribution (Balanced Data)", ylabel="# Samples"),
+        chart("bar", "balanced_split_output/avg_confidence.png",
+              labels=by_confidence["iab_label"].tolist(), values=by_confidence["avg_confidence"].tolist(),
+              title="Average Confidence per Class", ylabel="Avg Confidence", color="orange"),
+    ]
+
+    if {"pct_synthetic", "pct_natural", "pct_manual"}.issubset(meta.columns):
+        specs.append(chart(
+            "stacked", "balanced_split_output/source_composition.png",
+            labels=meta["iab_label"].tolist(),
+            columns={c: meta[c].tolist() for c in ["pct_synthetic", "pct_natural", "pct_manual"]},
+            title="Source Composition (% Synthetic, Natural, Manual)", ylabel="%",
+            colors=["#ff9999", "#99ccff", "#a0e57c"],
+        ))
+    else:
+        print("\n⚠️ No 'source' column found → skipping source composition plot.")
+    return specs
+
+
+def word_frequency_charts(train_df, word_freq_folder):
+    with span("charts.word_frequencies", rows=len(train_df)):
+        top_words = word_frequencies(train_df, top_n=TOP_N_WORDS)
+    specs = []
+    for label, words in top_words.groupby("iab_label", sort=False):
+        word_freq_filename = os.path.join(word_freq_folder, f"word_freq_{bs.label_safe(label)}.png")
+        specs.append(chart("words", word_freq_filename, words=words["word"].tolist(),
+                           counts=words["count"].tolist(), title=f"Top {TOP_N_WORDS} Words in Class: {label}"))
+    return specs
+
+
+def render(specs, pool):
+    with span("charts.render", charts=len(specs)) as step:
+        rendered, skipped = render_charts(specs, pool)
+        step.set(rendered=len(rendered))
+    return rendered, skipped
+
+
+def report(rendered, skipped):
+    for path in rendered:
+        print(f"✅ Saved {path}")
+    if skipped:
+        print(f"⏩ {len(skipped)} chart(s) unchanged since last run → skipped")
+
+
+def class_exports():
+    # One file per class → balanced_split_output/classes/
+    bs.export_class_files(read_dataset(bs.BALANCED_STEM))
+
+
+def split():
+    bs.split_and_save(read_dataset(bs.BALANCED_STEM))
+
+
+def metadata():
+    splits = [read_dataset(stem) for stem in SPLIT_STEMS]
+    bs.write_metadata(read_dataset(bs.BALANCED_STEM), *splits)
+
+
+def build_stages(pool):
+    def plot_metadata():
+        # Visualizing balanced dataset
+        report(*render(metadata_charts(pd.read_csv(META_FILE)), pool))
+
+    def plot_word_frequencies():
+        # Visualizing word variation per class → balanced_split_output/word_frequencies/
+        os.makedirs(WORD_FREQ_FOLDER, exist_ok=True)
+        # Only the two columns the word-frequency step needs (column projection on Parquet)
+        train_df = read_dataset(SPLIT_STEMS[0], columns=["text", "iab_label"])
+        report(*render(word_frequency_charts(train_df, WORD_FREQ_FOLDER), pool))
+
+    combined = dataset_files(merge.OUTPUT_STEM)
+    balanced = dataset_files(bs.BALANCED_STEM)
+    splits = [path for stem in SPLIT_STEMS for path in dataset_files(stem)]
+    ext = "parquet" if STORAGE_FORMAT == "parquet" else "csv"
+    stages = [
+        Stage("merge", merge.main,
+              inputs=CHUNK_FILES + ["merge_batches_from_chunks.py", "near_duplicates.py", "dataset_io.py"],
+              outputs=combined + ([merge.NEAR_DUP_STATS_FILE] if merge.NEAR_DEDUP else []),
+              params={"near_dedup": merge.near_dedup_params()}),
+        Stage("balance", bs.balance, inputs=combined + ["balance_and_split.py", "active_learning.py"],
+              outputs=balanced + [os.path.join(bs.MISSING_FOLDER, "missing_*.csv")]),
+        Stage("class_exports", class_exports, inputs=balanced,
+              outputs=[os.path.join(bs.CLASS_FOLDER, f"class_*.{ext}")]),
+        Stage("split", split, inputs=balanced, outputs=splits),
+        Stage("metadata", metadata, inputs=balanced + splits, outputs=METADATA_FILES),
+        Stage("plot_metadata", plot_metadata, inputs=[META_FILE, "charts.py"],
+              outputs=[os.path.join(bs.OUTPUT_FOLDER, "*.png")]),
+        Stage("plot_words", plot_word_frequencies, inputs=splits[:1] + ["charts.py"],
+              outputs=[os.path.join(WORD_FREQ_FOLDER, "*.png")], params={"top_n": TOP_N_WORDS}),
+    ]
+    if TOKENIZE_SPLITS:
+        stages.append(Stage("tokenize", tokenized_cache.export_splits, inputs=splits + ["tokenized_cache.py"],
+                            outputs=tokenized_cache.meta_files(),
+                            params={"tokenizer": tokenized_cache.TOKENIZER_NAME,
+                                    "max_length": tokenized_cache.MAX_LENGTH}))
+    return stages
+
+
+def main():
+    with chart_pool(CHART_WORKERS) as pool:
+        runner = PipelineRunner(build_stages(pool), max_workers=STAGE_WORKERS, force=FORCE)
+        runner.run()
+    runner.report()
+
+    if merge.NEAR_DEDUP and os.path.exists(merge.NEAR_DUP_STATS_FILE):
+        with open(merge.NEAR_DUP_STATS_FILE, "r") as f:
+            near_duplicates.print_stats(json.load(f))
+
+    print("\n🎉 FULL PIPELINE COMPLETE! Outputs in balanced_split_output/ 🚀")
+
+
+if __name__ == "__main__":
+    run_main(main, "run_full_pipeline")
@@ -0,0 +1,145 @@
+# sharded_labeling.py — N worker processes pulling batch ranges from a shared queue
+import multiprocessing as mp
+import os
+import queue
+import threading
+
+from instrumentation import span
+from labeling_manifest import write_csv_atomic
+from zero_shot_engine import ThroughputStats
+
+
+def core_sets(num_workers):
+    """Split the CPUs this process may run on into num_workers contiguous sets."""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    num_workers = min(num_workers, len(cores))
+    size, extra = divmod(len(cores), num_workers)
+    sets, start = [], 0
+    for i in range(num_workers):
+        end = start + size + (1 if i < extra else 0)
+        sets.append(cores[start:end])
+        start = end
+    return sets
+
+
+def worker_main(worker_id, cores, backend, task_queue, result_queue):
+    # Pin this worker (and its torch thread pool) to its own core set
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    import torch
+    torch.set_num_threads(len(cores))
+
+    from labeling_backends import load_classifier
+    from train import label_batch, open_label_cache
+
+    classifier = load_classifier(backend, device=-1)
+    cache = open_label_cache()  # one SQLite connection per worker
+    print(f"🧵 Worker {worker_id} ready on cores {cores}")
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        batch_filename, batch_texts, info = task
+        with span("train.batch", rows=len(batch_texts), batch=batch_filename, worker=worker_id):
+            batch_df, batch_stats = label_batch(classifier, batch_texts, cache)
+        rows, checksum = write_csv_atomic(batch_df, batch_filename)
+        result_queue.put((batch_filename, rows, checksum, info, batch_stats))
+
+    result_queue.put(worker_id)  # this worker is done
+
+
+def run_sharded(tasks, num_workers, backend, on_batch_done):
+    """Label tasks = iterable of (batch_filename, texts, info) with num_workers processes.
+
+    Workers write their own batch CSVs atomically; on_batch_done(batch_filename, rows,
+    checksum, info) is called from a single collector thread in this process; if it
+    raises, the workers are stopped and the error is re-raised here. After a worker
+    crash no new tasks go out, but batches the other workers finish are still
+    recorded before the crash is raised. Returns the merged ThroughputStats.
+    """
+    ctx = mp.get_context("spawn")
+    task_queue = ctx.Queue(maxsize=num_workers * 2)  # bounded → producer never runs far ahead
+    result_queue = ctx.Queue()
+    sets = core_sets(num_workers)
+
+    workers = [
+        ctx.Process(target=worker_main, args=(i, cores, backend, task_queue, result_queue), daemon=True)
+        for i, cores in enumerate(sets)
+    ]
+    for worker in workers:
+        worker.start()
+
+    run_stats = ThroughputStats()
+    collector_errors = []
+
+    def crashed_workers():
+        return [w for w in workers if w.exitcode not in (None, 0)]
+
+    def check_workers():
+        crashed = crashed_workers()
+        if crashed:
+            raise RuntimeError(f"❌ {len(crashed)} labeling worker(s) exited with errors; completed batches are in the manifest.")
+
+    def check_collector():
+        if collector_errors:
+            # Nobody drains result_queue any more → workers would block on exit, so stop them
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
+            raise RuntimeError("❌ Recording a labeled batch failed; completed batches are in the manifest.") from collector_errors[0]
+
+    def collect():
+        try:
+            collect_results()
+        except BaseException as e:
+            collector_errors.append(e)
+
+    def collect_results():
+        done = set()
+        while len(done) < len(workers):
+            try:
+                result = result_queue.get(timeout=5)
+            except queue.Empty:
+                # A crashed worker never reports done → stop once every other one has and nothing is left to read
+                if all(i in done or w.exitcode not in (None, 0) for i, w in enumerate(workers)):
+                    return
+                continue
+            if isinstance(result, int):
+                done.add(result)
+                continue
+            batch_filename, rows, checksum, info, batch_stats = result
+            run_stats.merge(batch_stats)
+            on_batch_done(batch_filename, rows, checksum, info)
+            print(f"✅ Saved {batch_filename}! ({batch_stats.report(prefix='').strip()})")
+
+    collector = threading.Thread(target=collect, daemon=True)
+    collector.start()
+
+    def put(item, until):
+        """Put item on the task queue → False if until() turned true while the queue was full."""
+        while True:
+            try:
+                task_queue.put(item, timeout=5)
+                return True
+            except queue.Full:
+                check_collector()
+                if until():
+                    return False
+
+    # After a crash no new tasks go out; the surviving workers finish what is queued and get their
+    # end marker, and the collector records their batches before the crash is raised
+    for task in tasks:
+        check_collector()
+        if crashed_workers() or not put(task, until=crashed_workers):
+            break
+    for _ in workers:
+        put(None, until=lambda: all(w.exitcode is not None for w in workers))
+
+    collector.join()
+    check_collector()
+    for worker in workers:
+        worker.join()
+    check_workers()
+    return run_stats
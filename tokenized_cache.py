@@ -0,0 +1,220 @@
+# tokenized_cache.py — tokenize the train/val/test splits once → memory-mapped token arrays for fine-tuning
+#
+#   python tokenized_cache.py export --tokenizer distilbert-base-uncased --max-length 64
+#   python tokenized_cache.py info
+#
+# Layout: tokenized_cache/<tokenizer>__len<max_length>/<split>/
+#   input_ids.npy  int32 [rows, max_length], right-padded with the tokenizer's pad id
+#   lengths.npy    int32 [rows] real tokens per row (attention mask = position < length)
+#   labels.npy     int16 [rows] index into iab_labels (-1 → label not in iab_labels)
+#   meta.json      tokenizer, max_length, pad id, sha256 of the split file; written last
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+from dataset_io import dataset_path, read_dataset
+from iab_labels import iab_labels
+from instrumentation import span
+from labeling_manifest import file_checksum, write_atomic
+
+# CONFIG
+CACHE_DIR = "tokenized_cache"
+TOKENIZER_NAME = "distilbert-base-uncased"  # model to fine-tune → its tokenizer
+MAX_LENGTH = 64  # search queries are short; longer texts are truncated
+SPLIT_STEMS = {name: os.path.join("balanced_split_output", name) for name in ["train", "val", "test"]}
+ENCODE_ROWS = 20000  # texts per tokenizer call (bounds the Python lists held at once)
+META_FILE = "meta.json"
+
+
+def cache_key(tokenizer_name, max_length):
+    return f"{tokenizer_name.strip('/').replace('/', '--')}__len{max_length}"
+
+
+def split_dir(split, tokenizer_name=TOKENIZER_NAME, max_length=MAX_LENGTH, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, cache_key(tokenizer_name, max_length), split)
+
+
+def split_hash(stem):
+    return file_checksum(dataset_path(stem) if os.path.exists(dataset_path(stem)) else dataset_path(stem, "csv"))
+
+
+def read_meta(folder):
+    path = os.path.join(folder, META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def is_fresh(folder, tokenizer_name, max_length, source_hash):
+    meta = read_meta(folder)
+    return (meta is not None and meta["tokenizer"] == tokenizer_name and meta["max_length"] == max_length
+            and meta["source_sha256"] == source_hash)
+
+
+def label_ids(labels):
+    ids = {label: i for i, label in enumerate(iab_labels)}
+    return np.array([ids.get(label, -1) for label in labels], dtype=np.int16)
+
+
+def fill_rows(input_ids, start, encoded):
+    """Copy ragged token lists into input_ids[start:] in one vectorized scatter → their lengths."""
+    lengths = np.fromiter((len(ids) for ids in encoded), dtype=np.int32, count=len(encoded))
+    flat = np.fromiter((t for ids in encoded for t in ids), dtype=np.int32, count=int(lengths.sum()))
+    rows = np.repeat(np.arange(start, start + len(encoded)), lengths)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    input_ids[rows, np.arange(len(flat)) - offsets] = flat
+    return lengths
+
+
+def export_split(split, stem, tokenizer, tokenizer_name, max_length, cache_dir=CACHE_DIR):
+    """Tokenize one split into its cache folder unless it is already there for this split file."""
+    folder = split_dir(split, tokenizer_name, max_length, cache_dir)
+    source_hash = split_hash(stem)
+    if is_fresh(folder, tokenizer_name, max_length, source_hash):
+        print(f"⏩ {folder} is up to date")
+        return folder
+
+    df = read_dataset(stem, columns=["text", "iab_label"])
+    texts = df["text"].astype(str).tolist()
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+
+    # Build next to the final folder, then swap it in → readers never see a half-written cache
+    tmp_folder = f"{folder}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    with span("tokenize.split", rows=len(texts), split=split, tokenizer=tokenizer_name):
+        input_ids = np.lib.format.open_memmap(os.path.join(tmp_folder, "input_ids.npy"), mode="w+",
+                                              dtype=np.int32, shape=(len(texts), max_length))
+        input_ids[:] = pad_id
+        lengths = np.empty(len(texts), dtype=np.int32)
+        for start in range(0, len(texts), ENCODE_ROWS):
+            encoded = tokenizer(texts[start:start + ENCODE_ROWS], truncation=True, max_length=max_length,
+                                return_attention_mask=False, return_token_type_ids=False)["input_ids"]
+            lengths[start:start + len(encoded)] = fill_rows(input_ids, start, encoded)
+        input_ids.flush()
+        del input_ids
+
+    labels = label_ids(df["iab_label"].astype(str))
+    np.save(os.path.join(tmp_folder, "lengths.npy"), lengths)
+    np.save(os.path.join(tmp_folder, "labels.npy"), labels)
+    meta = {
+        "tokenizer": tokenizer_name,
+        "max_length": max_length,
+        "pad_token_id": pad_id,
+        "rows": len(texts),
+        "truncated_or_full": int((lengths == max_length).sum()),
+        "unknown_labels": int((labels < 0).sum()),
+        "labels": iab_labels,
+        "source": stem,
+        "source_sha256": source_hash,
+    }
+    write_atomic(os.path.join(tmp_folder, META_FILE), lambda f: json.dump(meta, f, indent=2))
+
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp_folder, folder)
+    print(f"✅ {split}: {len(texts)} rows → {folder} "
+          f"(mean {lengths.mean() if len(lengths) else 0:.1f} tokens, {meta['truncated_or_full']} at max_length)")
+    return folder
+
+
+def export_splits(tokenizer_name=TOKENIZER_NAME, max_length=MAX_LENGTH, cache_dir=CACHE_DIR):
+    """Tokenize every split in SPLIT_STEMS → list of cache folders (unchanged splits are skipped)."""
+    stale = [split for split, stem in SPLIT_STEMS.items()
+             if not is_fresh(split_dir(split, tokenizer_name, max_length, cache_dir), tokenizer_name, max_length,
+                             split_hash(stem))]
+    tokenizer = None
+    if stale:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    return [export_split(split, stem, tokenizer, tokenizer_name, max_length, cache_dir)
+            for split, stem in SPLIT_STEMS.items()]
+
+
+def meta_files(tokenizer_name=TOKENIZER_NAME, max_length=MAX_LENGTH, cache_dir=CACHE_DIR):
+    return [os.path.join(split_dir(split, tokenizer_name, max_length, cache_dir), META_FILE) for split in SPLIT_STEMS]
+
+
+class MemmapTokenDataset:
+    """Read-only view of one tokenized split; arrays are memory-mapped, nothing is tokenized.
+
+    Indexing returns numpy rows (PyTorch's DataLoader collates them into tensors);
+    batches() hands out whole batches, trimmed to the longest row in each, and
+    contiguous unshuffled batches are views of the mapped file (no copy).
+    """
+
+    def __init__(self, split, tokenizer_name=TOKENIZER_NAME, max_length=MAX_LENGTH, cache_dir=CACHE_DIR):
+        folder = split_dir(split, tokenizer_name, max_length, cache_dir)
+        self.meta = read_meta(folder)
+        if self.meta is None:
+            raise FileNotFoundError(f"❌ No tokenized cache in {folder} → run `python tokenized_cache.py export` first.")
+        self.input_ids = np.load(os.path.join(folder, "input_ids.npy"), mmap_mode="r")
+        self.lengths = np.load(os.path.join(folder, "lengths.npy"), mmap_mode="r")
+        self.labels = np.load(os.path.join(folder, "labels.npy"), mmap_mode="r")
+        self.label_names = self.meta["labels"]
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, idx):
+        length = int(self.lengths[idx])
+        return {
+            "input_ids": self.input_ids[idx, :length],
+            "attention_mask": np.ones(length, dtype=np.int32),
+            "labels": int(self.labels[idx]),
+        }
+
+    def batch(self, rows):
+        """rows: slice or index array → dict of arrays, padded only to the longest row."""
+        lengths = self.lengths[rows]
+        width = int(lengths.max()) if len(lengths) else 0
+        return {
+            "input_ids": self.input_ids[rows, :width],
+            "attention_mask": (np.arange(width) < lengths[:, None]).astype(np.int32),
+            "labels": self.labels[rows],
+        }
+
+    def batches(self, batch_size, shuffle=False, seed=None, drop_last=False):
+        if not shuffle:
+            for start in range(0, len(self), batch_size):
+                if drop_last and start + batch_size > len(self):
+                    break
+                yield self.batch(slice(start, start + batch_size))
+            return
+        order = np.random.default_rng(seed).permutation(len(self))
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            if drop_last and len(rows) < batch_size:
+                break
+            yield self.batch(np.sort(rows))  # sorted → sequential reads from the mapped file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory-mapped tokenized cache of the balanced splits.")
+    parser.add_argument("command", choices=["export", "info"])
+    parser.add_argument("--tokenizer", default=TOKENIZER_NAME)
+    parser.add_argument("--max-length", type=int, default=MAX_LENGTH)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_splits(args.tokenizer, args.max_length, args.cache_dir)
+        return
+
+    for split in SPLIT_STEMS:
+        folder = split_dir(split, args.tokenizer, args.max_length, args.cache_dir)
+        meta = read_meta(folder)
+        if meta is None:
+            print(f"❌ {split}: not exported ({folder})")
+            continue
+        stale = "" if meta["source_sha256"] == split_hash(SPLIT_STEMS[split]) else " ⚠️ split changed since export"
+        print(f"✅ {split}: {meta['rows']} rows, {meta['truncated_or_full']} at max_length, "
+              f"{meta['unknown_labels']} unknown labels → {folder}{stale}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
 # train.py (FINAL MASTER VERSION — multi-file, per-folder, auto-resume, correct folder naming)
-from transformers import pipeline
 import pandas as pd
-import json
 import os
 import glob
+import json
+from zero_shot_engine import label_texts, ThroughputStats, HYPOTHESIS_TEMPLATE
+from labeling_backends import load_classifier, backend_model_name
+from label_cache import LabelCache
+from labeling_manifest import BatchManifest, write_csv_atomic
+from json_stream import iter_text_batches
+from iab_labels import candidate_labels, to_full_label
+from instrumentation import run_main, span
 
 # CONFIG
 TRAINING_FOLDER = "training_data"
@@ -11,101 +17,150 @@ OUTPUT_FOLDER = "output_chunks"
 BATCH_SIZE = 1000
 INFER_BATCH_SIZE = 16
 TOTAL_ROWS = 300000  # or len(texts) if smaller!
-
-# IAB labels
-iab_labels = [
-    "IAB1 Arts & Entertainment", "IAB2 Automotive", "IAB3 Business", "IAB4 Careers",
-    "IAB5 Education", "IAB6 Family & Parenting", "IAB7 Health & Fitness", "IAB8 Food & Drink",
-    "IAB9 Hobbies & Interests", "IAB10 Home & Garden", "IAB11 Law, Gov’t & Politics",
-    "IAB12 News", "IAB13 Personal Finance", "IAB14 Society", "IAB15 Science", "IAB16 Pets",
-    "IAB17 Sports", "IAB18 Style & Fashion", "IAB19 Technology & Computing", "IAB20 Travel",
-    "IAB21 Real Estate", "IAB22 Shopping", "IAB23 Religion & Spirituality", "IAB24 Uncategorized"
-]
-
-# Candidate labels (cleaned for model)
-candidate_labels = [label.split(" ", 1)[1] for label in iab_labels]
-
-# Load classifier
-classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli", device=0)  # device=0 → use GPU
-
-# Find all input files in training_data folder
-input_files = glob.glob(os.path.join(TRAINING_FOLDER, "train_text_only_*.json"))
-print(f"✅ Found {len(input_files)} input files to process.")
-
-# Process each input file
-for input_file in input_files:
-    # Extract part after "train_text_only_"
-    suffix = os.path.basename(input_file).replace("train_text_only_", "").replace(".json", "")
-    output_subfolder = os.path.join(OUTPUT_FOLDER, f"output_chunks_{suffix}")
-
-    os.makedirs(output_subfolder, exist_ok=True)
-    print(f"\n🚀 Processing file: {input_file}")
-    print(f"→ Output folder: {output_subfolder}")
-
-    # Load your data — auto-detect JSON or JSONL
-    with open(input_file, "r") as f:
-        first_char = f.read(1)
-        f.seek(0)
-        if first_char == "[":
-            print("Detected JSON array format.")
-            data = json.load(f)
-        else:
-            print("Detected JSONL format.")
-            data = [json.loads(line) for line in f]
-
-    df = pd.DataFrame(data)
-    df = df[["text"]]  # Only keep the "text" column
-
-    texts = df["text"].tolist()
-
-    # Loop in batches
-    for start_idx in range(0, min(TOTAL_ROWS, len(texts)), BATCH_SIZE):
-        end_idx = start_idx + BATCH_SIZE
-        batch_filename = os.path.join(output_subfolder, f"labeled_batch_{start_idx}_{end_idx}.csv")
-
-        # Auto-resume → skip if batch already exists
-        if os.path.exists(batch_filename):
-            print(f"⏩ Skipping already processed batch {start_idx} to {end_idx}...")
+USE_LENGTH_BUCKETING = True  # False → the original loop: INFER_BATCH_SIZE texts per call, pipeline default batch_size=1 (for comparison)
+MAX_BATCH_TOKENS = 8192  # padded (premise + hypothesis) tokens per forward pass, summed over all label pairs
+MAX_BATCH_ROWS = 64
+DEVICE = None  # None → first GPU if available, else CPU; 0 → first GPU, -1 → CPU (sharded workers always run on CPU)
+NUM_WORKERS = 1  # > 1 → sharded mode: one model copy per worker process, each pinned to its own core set
+ADOPT_EXISTING_BATCHES = True  # record complete-looking batch CSVs from pre-manifest runs instead of redoing them
+LABELING_BACKEND = "pipeline"  # "pipeline" (BART-MNLI, 24 encoder passes per text), "embedding" (one premise encoding per text)
+# or "cascade" (TF-IDF model trained by cascade_classifier.py answers confident rows, BART-MNLI the rest),
+# "quantized" (BART-MNLI with int8 Linear layers, CPU) or "onnx" (exported graph on onnxruntime, CPU)
+USE_LABEL_CACHE = True  # reuse labels for texts seen before (any run / input file), keyed by model + label set
+LABEL_CACHE_PATH = "label_cache.sqlite"
+SAVE_SCORES = True  # also save every label's score ("scores" column, JSON list in iab_labels order) → active_learning.py
+ACTIVE_LEARNING = False  # True → label only the prioritized queues written by `python active_learning.py queue`
+ACTIVE_QUEUE_MARKER = "_active_r"  # train_text_only_<source>_active_r<round>.json
+
+
+def open_label_cache():
+    if not USE_LABEL_CACHE:
+        return None
+    return LabelCache(LABEL_CACHE_PATH, backend_model_name(LABELING_BACKEND), candidate_labels, HYPOTHESIS_TEMPLATE)
+
+
+def label_batch(classifier, batch_texts, cache=None):
+    """Label one batch of texts → (DataFrame[text, iab_label, confidence], ThroughputStats)."""
+    batch_results = []
+
+    # Run zero-shot → outputs come back in the original order (None for empty texts)
+    batch_stats = ThroughputStats()
+    if USE_LENGTH_BUCKETING:
+        outputs = label_texts(
+            classifier, batch_texts, candidate_labels,
+            max_batch_tokens=MAX_BATCH_TOKENS, max_batch_rows=MAX_BATCH_ROWS, stats=batch_stats, cache=cache
+        )
+    else:
+        outputs = label_texts(
+            classifier, batch_texts, candidate_labels,
+            max_batch_tokens=float("inf"), max_batch_rows=INFER_BATCH_SIZE, bucketed=False, stats=batch_stats,
+            cache=cache
+        )
+
+    # Process outputs
+    for text, output in zip(batch_texts, outputs):
+        if output is None:
             continue
+        top_label = output["labels"][0]
+        score = round(output["scores"][0], 2)
+
+        # Map back to full IAB label
+        full_label = to_full_label(top_label)
+
+        row = (text, full_label, score)
+        if SAVE_SCORES:
+            by_label = dict(zip(output["labels"], output["scores"]))
+            row += (json.dumps([round(by_label[label], 4) for label in candidate_labels], separators=(",", ":")),)
+        batch_results.append(row)
+
+    columns = ["text", "iab_label", "confidence"] + (["scores"] if SAVE_SCORES else [])
+    batch_df = pd.DataFrame(batch_results, columns=columns)
+    return batch_df, batch_stats
+
+
+def iter_pending_batches(input_files, manifests):
+    """Yield (batch_filename, texts, info) for every batch not yet in its folder's manifest.
+
+    Texts are streamed from the input file batch by batch, starting after the last
+    contiguous completed batch, so memory stays flat whatever the file size.
+    """
+    for input_file in input_files:
+        # Extract part after "train_text_only_"
+        suffix = os.path.basename(input_file).replace("train_text_only_", "").replace(".json", "")
+        output_subfolder = os.path.join(OUTPUT_FOLDER, f"output_chunks_{suffix}")
+
+        os.makedirs(output_subfolder, exist_ok=True)
+        manifest = manifests.setdefault(output_subfolder, BatchManifest(output_subfolder))
+        print(f"\n🚀 Processing file: {input_file}")
+        print(f"→ Output folder: {output_subfolder}")
+
+        resume_row, resume_offset = manifest.resume_point()
+        if resume_row:
+            print(f"⏩ Resuming at row {resume_row} (byte offset {resume_offset})")
+
+        # Stream batches of the "text" field — JSON array or JSONL is auto-detected
+        batches = iter_text_batches(
+            input_file, BATCH_SIZE, start_row=resume_row, start_offset=resume_offset, max_rows=TOTAL_ROWS
+        )
+        for start_idx, batch_texts, next_offset in batches:
+            end_idx = start_idx + BATCH_SIZE
+            batch_filename = os.path.join(output_subfolder, f"labeled_batch_{start_idx}_{end_idx}.csv")
+            info = {"start": start_idx, "end": end_idx, "next_row": start_idx + len(batch_texts), "next_offset": next_offset}
+
+            # Auto-resume → skip batches the manifest vouches for (half-written CSVs are redone)
+            if manifest.is_complete(batch_filename):
+                print(f"⏩ Skipping already processed batch {start_idx} to {end_idx}...")
+                continue
+            if ADOPT_EXISTING_BATCHES and os.path.exists(batch_filename) and manifest.adopt(batch_filename, **info):
+                print(f"⏩ Adopted existing batch {start_idx} to {end_idx} into the manifest.")
+                continue
 
-        batch_texts = texts[start_idx:end_idx]
+            yield batch_filename, batch_texts, info
 
-        batch_results = []
-        print(f"\n🚀 Processing batch {start_idx} to {end_idx}...")
 
-        # Loop in inference sub-batches
-        for infer_start in range(0, len(batch_texts), INFER_BATCH_SIZE):
-            infer_end = infer_start + INFER_BATCH_SIZE
-            infer_texts = batch_texts[infer_start:infer_end]
+def main():
+    # Find all input files in training_data folder
+    input_files = glob.glob(os.path.join(TRAINING_FOLDER, "train_text_only_*.json"))
+    input_files = [f for f in input_files if (ACTIVE_QUEUE_MARKER in os.path.basename(f)) == ACTIVE_LEARNING]
+    print(f"✅ Found {len(input_files)} input files to process.")
 
-            # Filter empty strings
-            infer_texts = [t for t in infer_texts if t.strip() != ""]
-            if len(infer_texts) == 0:
-                print(f"⚠️ Skipping empty infer_texts at batch {start_idx}-{end_idx}, sub-batch {infer_start}-{infer_end}")
-                continue
+    manifests = {}
+
+    def on_batch_done(batch_filename, rows, checksum, info):
+        manifests[os.path.dirname(batch_filename)].record(batch_filename, rows, checksum, **info)
 
-            # Run zero-shot
-            outputs = classifier(infer_texts, candidate_labels)
+    tasks = iter_pending_batches(input_files, manifests)
 
-            # If single input → outputs is dict; if multiple → list of dicts
-            if isinstance(outputs, dict):
-                outputs = [outputs]
+    if NUM_WORKERS > 1:
+        from sharded_labeling import run_sharded
 
-            # Process outputs
-            for text, output in zip(infer_texts, outputs):
-                top_label = output["labels"][0]
-                score = round(output["scores"][0], 2)
+        print(f"🧵 Sharded mode: {NUM_WORKERS} workers, '{LABELING_BACKEND}' backend on CPU.")
+        run_stats = run_sharded(tasks, NUM_WORKERS, LABELING_BACKEND, on_batch_done)
+    else:
+        # Load classifier
+        with span("train.load_model", backend=LABELING_BACKEND):
+            classifier = load_classifier(LABELING_BACKEND, device=DEVICE)
+        print(f"✅ Loaded '{LABELING_BACKEND}' labeling backend.")
+        cache = open_label_cache()
 
-                # Map back to full IAB label
-                full_label = next(iab for iab in iab_labels if iab.endswith(top_label))
+        run_stats = ThroughputStats()
+        for batch_filename, batch_texts, info in tasks:
+            print(f"\n🚀 Processing batch {info['start']} to {info['end']}...")
+            with span("train.batch", rows=len(batch_texts), batch=batch_filename) as step:
+                batch_df, batch_stats = label_batch(classifier, batch_texts, cache)
+                step.set(cache_hits=batch_stats.cache_hits, padding_ratio=round(batch_stats.padding_ratio, 4))
+            run_stats.merge(batch_stats)
+            print(batch_stats.report())
 
-                batch_results.append((text, full_label, score))
+            # Save batch (write-then-rename) and record it in the manifest
+            with span("train.write_batch", rows=len(batch_df)):
+                rows, checksum = write_csv_atomic(batch_df, batch_filename)
+            on_batch_done(batch_filename, rows, checksum, info)
+            print(f"✅ Saved {batch_filename}!")
 
-            print(f"Processed {min(infer_end, len(batch_texts))} / {len(batch_texts)} in current batch...")
+    print("\n🎉 All files processed!")
+    print(run_stats.report(prefix=f"📈 Run throughput (length bucketing={USE_LENGTH_BUCKETING}):"))
 
-        # Save batch
-        batch_df = pd.DataFrame(batch_results, columns=["text", "iab_label", "confidence"])
-        batch_df.to_csv(batch_filename, index=False)
-        print(f"✅ Saved {batch_filename}!")
 
-print("\n🎉 All files processed!")
+if __name__ == "__main__":
+    run_main(main, "train")
@@ -0,0 +1,194 @@
+# zero_shot_engine.py — length-bucketed, token-budget batching for the zero-shot labeler
+import time
+
+from instrumentation import span
+from label_cache import text_key
+
+HYPOTHESIS_TEMPLATE = "This example is {}."
+
+
+def count_tokens(tokenizer, texts):
+    # Premise length in tokens (incl. special tokens), truncated like the pipeline does
+    encoded = tokenizer(list(texts), add_special_tokens=True, truncation=True)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def hypothesis_tokens(tokenizer, candidate_labels, hypothesis_template=HYPOTHESIS_TEMPLATE):
+    # Longest hypothesis → every (premise, hypothesis) pair is at most premise + this
+    hypotheses = [hypothesis_template.format(label) for label in candidate_labels]
+    encoded = tokenizer(hypotheses, add_special_tokens=False)
+    return max(len(ids) for ids in encoded["input_ids"])
+
+
+def build_batches(lengths, num_labels, max_batch_tokens, max_batch_rows, bucketed=True):
+    """Group row indices so each forward pass stays under max_batch_tokens.
+
+    A row costs num_labels pairs padded to the longest pair in its batch, so the
+    budget is checked against rows * num_labels * longest_length. With
+    bucketed=False rows keep their input order (the legacy fixed-size slices).
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__) if bucketed else range(len(lengths))
+
+    batches = []
+    current, current_max = [], 0
+    for idx in order:
+        new_max = max(current_max, lengths[idx])
+        over_budget = (len(current) + 1) * num_labels * new_max > max_batch_tokens
+        if current and (over_budget or len(current) >= max_batch_rows):
+            batches.append(current)
+            current, new_max = [], lengths[idx]
+        current.append(idx)
+        current_max = new_max
+    if current:
+        batches.append(current)
+    return batches
+
+
+class ThroughputStats:
+    """Accumulates rows/sec and padding ratio across labeling calls."""
+
+    def __init__(self):
+        self.rows = 0
+        self.batches = 0
+        self.seconds = 0.0
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cascade_rows = 0  # rows screened by a cascade's cheap first stage
+        self.early_exits = 0  # ... answered there without the full model
+        self.audit_rows = 0  # early exits also checked against the full model
+        self.audit_agreements = 0
+
+    def add(self, rows, seconds, real_tokens, padded_tokens, batches):
+        self.rows += rows
+        self.seconds += seconds
+        self.real_tokens += real_tokens
+        self.padded_tokens += padded_tokens
+        self.batches += batches
+
+    def merge(self, other):
+        self.add(other.rows, other.seconds, other.real_tokens, other.padded_tokens, other.batches)
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        self.cascade_rows += other.cascade_rows
+        self.early_exits += other.early_exits
+        self.audit_rows += other.audit_rows
+        self.audit_agreements += other.audit_agreements
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def padding_ratio(self):
+        return 1 - self.real_tokens / self.padded_tokens if self.padded_tokens else 0.0
+
+    def report(self, prefix="📈"):
+        line = (
+            f"{prefix} {self.rows} rows in {self.seconds:.1f}s → {self.rows_per_sec:.1f} rows/sec | "
+            f"{self.batches} forward batches | padding ratio {self.padding_ratio:.1%}"
+        )
+        if self.cache_hits or self.cache_misses:
+            line += f" | label cache {self.cache_hits} hits / {self.cache_misses} misses"
+        if self.cascade_rows:
+            line += f" | cascade: {self.early_exits / self.cascade_rows:.1%} of full-model calls avoided"
+            if self.audit_rows:
+                line += f", audit agreement {self.audit_agreements / self.audit_rows:.1%} ({self.audit_rows} rows)"
+        return line
+
+
+def label_texts(classifier, texts, candidate_labels, max_batch_tokens=8192, max_batch_rows=64,
+                bucketed=True, stats=None, cache=None):
+    """Run zero-shot classification on texts and return outputs in input order.
+
+    Empty / whitespace-only texts are not sent to the model; their slot is None.
+    Each non-empty slot holds the pipeline output dict ("labels", "scores").
+    bucketed=False reproduces the original loop: max_batch_rows texts per call in
+    input order, without batch_size (a transformers pipeline then runs one pair
+    per forward pass → no padding).
+    With a label_cache.LabelCache, cached texts skip the model and only one copy
+    of each uncached (normalized) text is classified.
+    """
+    results = [None] * len(texts)
+    keep = [i for i, t in enumerate(texts) if isinstance(t, str) and t.strip() != ""]
+    if not keep:
+        return results
+
+    if cache is not None:
+        keys = {i: text_key(texts[i]) for i in keep}
+        cached = cache.get_many(keys.values())
+        misses = {}
+        for i in keep:
+            if keys[i] in cached:
+                results[i] = cached[keys[i]]
+            else:
+                misses.setdefault(keys[i], []).append(i)
+
+        if stats is not None:
+            stats.cache_hits += len(keep) - sum(len(rows) for rows in misses.values())
+            stats.cache_misses += sum(len(rows) for rows in misses.values())
+
+        # Classify one representative per uncached key, then fan the output back out
+        firsts = [rows[0] for rows in misses.values()]
+        outputs = label_texts(classifier, [texts[i] for i in firsts], candidate_labels,
+                              max_batch_tokens, max_batch_rows, bucketed, stats)
+        cache.put_many((key, output) for key, output in zip(misses, outputs) if not output.get("early_exit"))
+        for rows, output in zip(misses.values(), outputs):
+            for i in rows:
+                results[i] = output
+        return results
+
+    kept_texts = [texts[i] for i in keep]
+    if hasattr(classifier, "cascade_label"):
+        # Cascade: its cheap stage answers confident rows and hands the rest back here for the full model
+        def run_fallback(rest):
+            return label_texts(classifier.fallback, rest, candidate_labels, max_batch_tokens, max_batch_rows,
+                               bucketed, stats)
+
+        for i, output in zip(keep, classifier.cascade_label(kept_texts, candidate_labels, run_fallback, stats)):
+            results[i] = output
+        return results
+
+    # Pipelines that score (premise, hypothesis) pairs pay one pass per label; backends that
+    # encode the premise once declare pairs_per_text = 1
+    pairs = getattr(classifier, "pairs_per_text", len(candidate_labels))
+    hyp_len = hypothesis_tokens(classifier.tokenizer, candidate_labels) if pairs > 1 else 0
+    with span("label.tokenize", rows=len(kept_texts)):
+        lengths = [n + hyp_len for n in count_tokens(classifier.tokenizer, kept_texts)]
+    batches = build_batches(lengths, pairs, max_batch_tokens, max_batch_rows, bucketed)
+
+    unpadded = False
+    if not bucketed:
+        from transformers import Pipeline
+
+        unpadded = isinstance(classifier, Pipeline)
+
+    real_tokens = padded_tokens = forward_passes = 0
+    start_time = time.perf_counter()
+    for batch in batches:
+        batch_texts = [kept_texts[i] for i in batch]
+        batch_lengths = [lengths[i] for i in batch]
+        batch_real = sum(batch_lengths) * pairs
+        batch_padded = batch_real if unpadded else max(batch_lengths) * len(batch) * pairs
+        # One span per classifier call (sub-batch) → where inference time and memory go
+        with span("label.forward", rows=len(batch), padded_tokens=batch_padded):
+            if bucketed:
+                outputs = classifier(batch_texts, candidate_labels, batch_size=len(batch_texts) * pairs)
+            else:
+                outputs = classifier(batch_texts, candidate_labels)
+
+        # If single input → outputs is dict; if multiple → list of dicts
+        if isinstance(outputs, dict):
+            outputs = [outputs]
+
+        for i, output in zip(batch, outputs):
+            results[keep[i]] = output
+
+        real_tokens += batch_real
+        padded_tokens += batch_padded
+        forward_passes += len(batch) * pairs if unpadded else 1
+
+    if stats is not None:
+        stats.add(len(keep), time.perf_counter() - start_time, real_tokens, padded_tokens, forward_passes)
+    return results